@@ -8,8 +8,12 @@ import type { Claim } from "@/lib/types"
 
 type SupabaseListResponse<T> = {
   data?: T[]
+  next_cursor?: number | null
 }
 
+// The backend's maximum page size; fewer round trips when walking every claim
+const CLAIMS_PAGE_SIZE = 500
+
 function pickFirst<T>(...values: T[]): T | undefined {
   for (const v of values) {
     if (v !== undefined && v !== null) return v
@@ -58,14 +62,27 @@ async function getClaimsFromBackend(): Promise<Claim[]> {
   const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000"
   const base = apiUrl.replace(/\/$/, "")
 
-  const res = await fetch(`${base}/claims`, { cache: "no-store" })
-  if (!res.ok) {
-    throw new Error(`Failed to fetch claims: ${res.status} ${res.statusText}`)
-  }
-
-  const json = (await res.json()) as unknown
-  const rows =
-    Array.isArray(json) ? json : (json as SupabaseListResponse<any>)?.data ?? []
+  // GET /claims is paginated: follow next_cursor until the last page
+  const rows: any[] = []
+  let after: number | null | undefined = undefined
+  do {
+    const params = new URLSearchParams({ limit: String(CLAIMS_PAGE_SIZE) })
+    if (after !== undefined && after !== null) params.set("after", String(after))
+
+    const res = await fetch(`${base}/claims?${params}`, { cache: "no-store" })
+    if (!res.ok) {
+      throw new Error(`Failed to fetch claims: ${res.status} ${res.statusText}`)
+    }
+
+    const json = (await res.json()) as unknown
+    if (Array.isArray(json)) {
+      rows.push(...json)
+      break
+    }
+    const page = json as SupabaseListResponse<any>
+    rows.push(...(page?.data ?? []))
+    after = page?.next_cursor
+  } while (after !== undefined && after !== null)
 
   return rows.map(mapBackendClaimToFrontend)
 }
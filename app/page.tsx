@@ -26,7 +26,7 @@ export default async function DashboardPage() {
     },
     {
       title: "Avg Processing Time",
-      value: `${analytics.averageReimbursementTime} days`,
+      value: analytics.averageReimbursementTime === null ? "N/A" : `${analytics.averageReimbursementTime} days`,
       change: -2.3,
       changeLabel: "2.3 days faster",
       icon: Clock,
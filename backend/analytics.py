@@ -0,0 +1,59 @@
+""" Reimbursement analytics built from the per payer/month claim rollups """
+import calendar
+from typing import Any
+
+ROLLUP_SUMS = (
+    "claims", "processing_claims", "paid_claims", "denied_claims",
+    "billed_amount", "expected_amount", "processed_expected_amount", "actual_amount",
+)
+
+# Claim_Rollups.month for claims whose date_of_service is not a date (see sql/claim_rollups.sql)
+UNKNOWN_MONTH = "unknown"
+
+
+def _month_label(month: str) -> str:
+    """ "2025-07" -> "Jul" """
+    try:
+        return calendar.month_abbr[int(month.split("-")[1])]
+    except (IndexError, ValueError):
+        return month
+
+
+def build_analytics(rollups: list[dict[str, Any]], months: int = 6) -> dict[str, Any]:
+    """
+    Combine Claim_Rollups rows into the frontend's Analytics shape.
+    Rollup rows are already aggregated in Postgres, so this is O(payers x months).
+    averageReimbursementTime and topDenialReasons need data we do not store yet.
+    Claims with an unparseable date_of_service count in the totals but not the monthly trend.
+    """
+    totals = dict.fromkeys(ROLLUP_SUMS, 0.0)
+    by_payer: dict[str, float] = {}
+    by_month: dict[str, dict[str, float]] = {}
+    for row in rollups:
+        for column in ROLLUP_SUMS:
+            totals[column] += float(row.get(column) or 0)
+        actual = float(row.get("actual_amount") or 0)
+        by_payer[row["payer"]] = by_payer.get(row["payer"], 0.0) + actual
+        month = by_month.setdefault(row["month"], {"revenue": 0.0, "claims": 0})
+        month["revenue"] += actual
+        month["claims"] += int(row.get("claims") or 0)
+
+    processed = totals["paid_claims"] + totals["denied_claims"]
+    return {
+        "totalRevenue": totals["actual_amount"],
+        "expectedRevenue": totals["processed_expected_amount"],
+        "revenueVariance": totals["actual_amount"] - totals["processed_expected_amount"],
+        "claimsProcessed": int(processed),
+        "claimsPending": int(totals["processing_claims"]),
+        "averageReimbursementTime": None,
+        "denialRate": round(totals["denied_claims"] / processed * 100, 1) if processed else 0.0,
+        "topDenialReasons": [],
+        "revenueByPayer": [
+            {"payer": payer, "amount": amount}
+            for payer, amount in sorted(by_payer.items(), key=lambda item: item[1], reverse=True)
+        ],
+        "monthlyTrend": [
+            {"month": _month_label(month), "revenue": values["revenue"], "claims": values["claims"]}
+            for month, values in sorted(item for item in by_month.items() if item[0] != UNKNOWN_MONTH)[-months:]
+        ] if months > 0 else [],
+    }
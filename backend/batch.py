@@ -0,0 +1,142 @@
+""" Batch ingestion of many claim forms with parallel parsing """
+import asyncio
+import json
+import logging
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+from typing import Any, AsyncIterator, Callable
+
+from uploads import MAX_ARCHIVE_MEMBERS, MAX_BATCH_EXPANDED_BYTES, MAX_UPLOAD_BYTES, SpooledUpload, spool_stream
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SUFFIXES = {".pdf", ".docx", ".txt", ".png", ".jpg", ".jpeg", ".tif", ".tiff"}
+
+
+class ArchiveTooLarge(Exception):
+    """ Raised when a zip archive has too many members or expands past its byte budget """
+
+
+def is_archive(filename: str) -> bool:
+    return PurePosixPath(filename).suffix.lower() == ".zip"
+
+
+def _wanted_members(archive: zipfile.ZipFile, filename: str) -> list[zipfile.ZipInfo]:
+    """ Archive members that are documents we can process """
+    members = []
+    for member in archive.infolist():
+        path = PurePosixPath(member.filename)
+        if member.is_dir() or path.name.startswith(".") or "__MACOSX" in path.parts:
+            continue
+        if path.suffix.lower() not in SUPPORTED_SUFFIXES:
+            logger.warning("Skipping unsupported archive member %s in %s", member.filename, filename)
+            continue
+        members.append(member)
+    return members
+
+
+def expand_upload(document: SpooledUpload, max_member_bytes: int = MAX_UPLOAD_BYTES,
+                  max_members: int = MAX_ARCHIVE_MEMBERS,
+                  max_expanded_bytes: int = MAX_BATCH_EXPANDED_BYTES) -> list[SpooledUpload]:
+    """
+    Turn one uploaded file into the documents it contains.
+    Zip archive members are streamed into their own spooled files and the archive is closed;
+    anything else is returned as-is.
+    The member count and the members' uncompressed sizes are checked against max_members and
+    max_expanded_bytes before anything is decompressed; zipfile never reads past a member's
+    declared size, so an archive cannot expand further than its directory says.
+    """
+    if not is_archive(document.filename):
+        return [document]
+
+    documents = []
+    try:
+        with zipfile.ZipFile(document) as archive:
+            if len(archive.infolist()) > max_members:
+                raise ArchiveTooLarge(f"{document.filename} has more than {max_members} members")
+            members = _wanted_members(archive, document.filename)
+            expanded = sum(member.file_size for member in members)
+            if expanded > max_expanded_bytes:
+                raise ArchiveTooLarge(f"{document.filename} expands to {expanded} bytes; only {max_expanded_bytes} more are allowed")
+            for member in members:
+                with archive.open(member) as stream:
+                    documents.append(spool_stream(stream, f"{document.filename}/{member.filename}", max_member_bytes))
+    except BaseException:
+        for member_document in documents:
+            member_document.close()
+        raise
+    finally:
+        document.close()
+    return documents
+
+
+def _summarize(results: list[dict[str, Any]], elapsed: float) -> dict[str, Any]:
+    """ Build the throughput, failure and per-stage timing summary for a batch """
+    succeeded = [r for r in results if r["status"] == "succeeded"]
+    stage_timings = {}
+    for result in succeeded:
+        for stage, seconds in result.get("timings", {}).items():
+            stage_timings.setdefault(stage, []).append(seconds)
+    return {
+        "type": "summary",
+        "total": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "failures": [{"filename": r["filename"], "error": r["error"]} for r in results if r["status"] == "failed"],
+        "elapsed_seconds": elapsed,
+        "documents_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+        "stage_timings": {
+            stage: {
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "max": max(values),
+            }
+            for stage, values in stage_timings.items()
+        },
+    }
+
+
+async def stream_batch(
+    documents: list[SpooledUpload],
+    handler: Callable[[SpooledUpload], dict[str, Any]],
+    concurrency: int,
+) -> AsyncIterator[str]:
+    """
+    Run handler(document) for every document on a bounded thread pool and yield
+    one NDJSON line per document as it completes, then a summary line.
+    Each document is closed once it has been processed.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    results = []
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch")
+
+    def handle_and_close(document: SpooledUpload) -> dict[str, Any]:
+        try:
+            return handler(document)
+        finally:
+            document.close()
+
+    async def run(document: SpooledUpload) -> dict[str, Any]:
+        try:
+            result = await loop.run_in_executor(executor, handle_and_close, document)
+            return {"type": "result", "filename": document.filename, "status": "succeeded", **result}
+        except Exception as e:
+            logger.error("Batch document %s failed: %s", document.filename, str(e))
+            return {"type": "result", "filename": document.filename, "status": "failed", "error": str(e)}
+
+    tasks = [asyncio.ensure_future(run(document)) for document in documents]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            results.append(result)
+            yield json.dumps(result, default=str) + "\n"
+    finally:
+        # If the client goes away, let running documents finish but drop the ones not started
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    yield json.dumps(_summarize(results, time.perf_counter() - started)) + "\n"
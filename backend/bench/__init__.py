@@ -0,0 +1 @@
+""" Load-test harness: run python -m bench.run --help from backend/ """
@@ -0,0 +1,359 @@
+""" Local stand-ins for LandingAI ADE and Supabase's PostgREST API used by the benchmark """
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from datetime import date
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+from urllib.parse import unquote
+
+import httpx
+
+FIRST_NAMES = ["JAMES", "MARY", "JOHN", "PATRICIA", "ROBERT", "JENNIFER", "MICHAEL", "LINDA", "DAVID", "ELIZABETH"]
+LAST_NAMES = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "RODRIGUEZ", "MARTINEZ"]
+PAYERS = ["Blue Cross Blue Shield", "United Healthcare", "Aetna", "Medicare", "Cigna"]
+PROCEDURES = [(99213, "Office Visit - Level 3"), (99214, "Office Visit - Level 4"), (80053, "Comprehensive Metabolic Panel"),
+              (93000, "Electrocardiogram"), (85025, "Complete Blood Count")]
+
+
+def fake_extraction(rng: random.Random, members: int = 1000) -> dict[str, Any]:
+    """ A claim form extraction matching ClaimFormExtractionSchema, drawn from a pool of `members` people """
+    member = rng.randrange(members)
+    last_name, first_name = LAST_NAMES[member % len(LAST_NAMES)], FIRST_NAMES[(member // len(LAST_NAMES)) % len(FIRST_NAMES)]
+    date_of_birth = f"{1940 + member % 60}-{1 + member % 12:02d}-{1 + member % 28:02d}"
+    return {
+        "insuredInformation": {
+            "last_name": last_name, "first_name": first_name, "middle_initial": None, "date_of_birth": date_of_birth,
+            "identification_number": 100000 + member, "gender": "F" if member % 2 else "M",
+            "address": f"{member} Main Street", "city": "Tampa", "state": "FL", "zip": f"{33000 + member % 900}",
+            "phone": "407 555 1212", "employer_name": None, "insurance_plan_name": rng.choice(PAYERS),
+            "another_insurance_plan": False, "other_identification_number": None,
+        },
+        "patientInformation": {
+            "insured_id": None, "patient_last_name": last_name, "patient_first_name": first_name, "patient_middle_initial": None,
+            "patient_date_of_birth": date_of_birth, "patient_gender": "F" if member % 2 else "M",
+            "patient_address": f"{member} Main Street", "patient_city": "Tampa", "patient_state": "FL",
+            "patient_zip": f"{33000 + member % 900}", "patient_phone": "407 555 1212", "status": None,
+            "relationship_to_insured": "Self", "condition_related_to_employment": "No",
+            "condition_related_to_auto_accident": "No", "date_of_current_illness": "2025-10-15",
+            "condition_related_to_other": None, "auto_accident_place": None, "attestation_id": None,
+        },
+        "otherInsuranceInformation": None,
+        "attestation": {
+            "date_of_patient_signed": "2025-11-05", "provider_name": "Tampa Clinic", "tax_number": 123456789,
+            "npi_number": 1234567890, "date_of_insured_signed": "2025-11-05",
+        },
+    }
+
+
+def fake_claim(rng: random.Random, patient_id: Optional[int] = None) -> dict[str, Any]:
+    """ A ClaimBase payload """
+    procedure_code, procedure_name = rng.choice(PROCEDURES)
+    billed = round(rng.uniform(50, 500), 2)
+    status = rng.choice(["processing", "paid", "paid", "denied"])
+    return {
+        "claim_id": f"CLM{rng.randrange(10 ** 9):09d}", "patient": "Bench Patient", "procedure_code": procedure_code,
+        "procedure_name": procedure_name, "date_of_service": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "payer": rng.choice(PAYERS), "billed_amount": billed, "expected": round(billed * 0.8, 2),
+        "actual": round(billed * rng.uniform(0.6, 0.8), 2) if status == "paid" else None,
+        "status": status, "patient_id": patient_id,
+    }
+
+
+class FakeLandingAIADE:
+    """ Drop-in for landingai_ade.LandingAIADE: sleeps for the configured latency and returns a synthetic form """
+    def __init__(self, parse_latency: float = 0.5, extract_latency: float = 0.5, jitter: float = 0.2, seed: int = 0,
+                 members: int = 1000, pages: int = 1):
+        self.parse_latency = parse_latency
+        self.pages = pages
+        self.extract_latency = extract_latency
+        self.jitter = jitter
+        self.members = members
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _sleep(self, latency: float):
+        with self._lock:
+            factor = 1 + self._rng.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, latency * factor))
+
+    def parse(self, document, split=None, **_kwargs):
+        # Read the whole upload like the real client does when it sends the file
+        while document.read(1024 * 1024):
+            pass
+        self._sleep(self.parse_latency)
+        # Distinct documents must give distinct markdown, or the extract cache would skip their extraction
+        name = f"{document.name} {getattr(document, 'sha256', '')[:16]}"
+        if split != "page":
+            return SimpleNamespace(markdown=f"# Claim form\n\n{name}\n", splits=[])
+        # One claim form per page, each starting with the form title
+        splits = [SimpleNamespace(pages=[page], markdown=f"# HEALTH INSURANCE CLAIM FORM\n\n{name} page {page}\n")
+                  for page in range(self.pages)]
+        return SimpleNamespace(markdown="\n\n".join(split.markdown for split in splits), splits=splits)
+
+    def extract(self, schema: str, markdown: str, **_kwargs):
+        self._sleep(self.extract_latency)
+        with self._lock:
+            extraction = fake_extraction(self._rng, self.members)
+        return SimpleNamespace(extraction=extraction)
+
+
+def claim_month(date_of_service: Any) -> str:
+    """ Same as claim_month() in sql/claim_rollups.sql: YYYY-MM, or 'unknown' for anything that isn't a date """
+    try:
+        return date.fromisoformat(str(date_of_service)[:10]).strftime("%Y-%m")
+    except ValueError:
+        return "unknown"
+
+
+def _parse_value(value: str) -> Any:
+    value = unquote(value)
+    if value == "null":
+        return None
+    if value in ("true", "false"):
+        return value == "true"
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value.strip('"')
+
+
+def _compare(row_value: Any, operator: str, value: str) -> bool:
+    if operator == "in":
+        return row_value in [_parse_value(item) for item in value.strip("()").split(",")]
+    if operator == "is":
+        return row_value is None if value == "null" else row_value == _parse_value(value)
+    expected = _parse_value(value)
+    if row_value is None:
+        return False
+    if isinstance(expected, (int, float)) and isinstance(row_value, str):
+        expected = str(expected)
+    try:
+        return {
+            "eq": row_value == expected, "neq": row_value != expected, "gt": row_value > expected,
+            "gte": row_value >= expected, "lt": row_value < expected, "lte": row_value <= expected,
+        }[operator]
+    except (KeyError, TypeError):
+        return False
+
+
+def _split_terms(terms: str) -> list[str]:
+    """ Split a logical filter's terms on top-level commas, leaving quoted values and nested groups whole """
+    parts, current, depth, quoted, escaped = [], "", 0, False, False
+    for char in terms:
+        if escaped:
+            escaped = False
+        elif char == "\\" and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    return parts + [current]
+
+
+def _matches_logical(row: dict[str, Any], operator: str, terms: str) -> bool:
+    """ PostgREST or=(...) / and=(...): terms are column.operator.value or nested or(...) / and(...) """
+    results = []
+    for term in _split_terms(terms.strip()[1:-1]):
+        if term.startswith(("or(", "and(")):
+            nested, _, nested_terms = term.partition("(")
+            results.append(_matches_logical(row, nested, "(" + nested_terms))
+            continue
+        column, operator_, value = term.split(".", 2)
+        if value.startswith('"'):
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        results.append(_compare(row.get(column), operator_, value))
+    return any(results) if operator == "or" else all(results)
+
+
+class FakePostgrest(httpx.BaseTransport):
+    """
+    In-memory PostgREST: tables of dict rows with the filters, ordering, limits, inserts, upserts,
+    updates, deletes, embeds and RPCs the backend uses, plus the Claim_Rollups trigger.
+    latency is added to every request to stand in for the network round trip.
+    """
+    RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns", "or", "and"}
+    # Embedded table -> the foreign key column that points at it
+    FOREIGN_KEYS = {"Patient_Information": "patient_id", "Insured_Information": "insured_id", "Attestation": "attestation_id"}
+    ROLLUP_SUMS = {"billed_amount": "billed_amount", "expected_amount": "expected", "actual_amount": "actual"}
+
+    def __init__(self, latency: float = 0.002):
+        self.latency = latency
+        self.tables: dict[str, dict[int, dict[str, Any]]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.rpcs: dict[str, Callable[[dict[str, Any]], Any]] = {
+            "create_claim_form_extraction": self._create_claim_form_extraction,
+            "update_claims": self._update_claims,
+            "pricing_rules_version": lambda _params: "bench",
+        }
+
+    def insert(self, table: str, row: dict[str, Any]) -> dict[str, Any]:
+        row = {**row, "id": row.get("id") or next(self._ids)}
+        self.tables.setdefault(table, {})[row["id"]] = row
+        if table == "Claims":
+            self._rollup(row, 1)
+        return row
+
+    def update(self, table: str, row: dict[str, Any], changes: dict[str, Any]):
+        if table == "Claims":
+            self._rollup(row, -1)
+        row.update(changes)
+        if table == "Claims":
+            self._rollup(row, 1)
+
+    def delete(self, table: str, row: dict[str, Any]):
+        del self.tables[table][row["id"]]
+        if table == "Claims":
+            self._rollup(row, -1)
+
+    def _rollup(self, claim: dict[str, Any], sign: int):
+        """ What the claims_rollup trigger does: add (sign=1) or remove (sign=-1) a claim from its payer/month """
+        rollups = self.tables.setdefault("Claim_Rollups", {})
+        key = (claim.get("payer"), claim_month(claim.get("date_of_service")))
+        rollup = rollups.setdefault(key, {
+            "payer": key[0], "month": key[1], "claims": 0, "processing_claims": 0, "paid_claims": 0,
+            "denied_claims": 0, "billed_amount": 0.0, "expected_amount": 0.0, "processed_expected_amount": 0.0, "actual_amount": 0.0,
+        })
+        status = claim.get("status")
+        rollup["claims"] += sign
+        if status in ("processing", "paid", "denied"):
+            rollup[f"{status}_claims"] += sign
+        for column, source in self.ROLLUP_SUMS.items():
+            rollup[column] += sign * float(claim.get(source) or 0)
+        if status in ("paid", "denied"):
+            rollup["processed_expected_amount"] += sign * float(claim.get("expected") or 0)
+
+    def _filtered(self, table: str, params: httpx.QueryParams) -> list[dict[str, Any]]:
+        rows_by_id = self.tables.get(table, {})
+        # By-id lookups are a primary key hit in Postgres; don't let the fake scan the table for them
+        id_filter = params.get("id", "")
+        if id_filter.startswith("eq."):
+            row = rows_by_id.get(_parse_value(id_filter[3:]))
+            rows = [row] if row is not None else []
+        else:
+            rows = list(rows_by_id.values())
+        for column, condition in params.multi_items():
+            if column in self.RESERVED or "." not in condition:
+                continue
+            operator, value = condition.split(".", 1)
+            rows = [row for row in rows if _compare(row.get(column), operator, value)]
+        for operator in ("or", "and"):
+            for terms in params.get_list(operator):
+                rows = [row for row in rows if _matches_logical(row, operator, terms)]
+        return rows
+
+    def _select(self, table: str, params: httpx.QueryParams) -> list[dict[str, Any]]:
+        rows = self._filtered(table, params)
+        for order in reversed(params.get("order", "").split(",") if params.get("order") else []):
+            column, _, direction = order.partition(".")
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction.startswith("desc"))
+        if "limit" in params:
+            rows = rows[:int(params["limit"])]
+        columns = params.get("select", "*")
+        if columns != "*":
+            rows = [self._project(row, columns) for row in rows]
+        return rows
+
+    def _project(self, row: dict[str, Any], columns: str) -> dict[str, Any]:
+        """ Apply a select list: plain columns, * and many-to-one embeds such as alias:Table(*) """
+        projected = {}
+        for column in columns.split(","):
+            if column == "*":
+                projected.update(row)
+            elif "(" in column:
+                alias, _, embed = column.partition(":")
+                table, _, embed_columns = (embed or alias).partition("(")
+                target = self.tables.get(table, {}).get(row.get(self.FOREIGN_KEYS.get(table, "")))
+                projected[alias if embed else table] = (
+                    self._project(target, embed_columns.rstrip(")")) if target is not None else None)
+            else:
+                projected[column] = row.get(column)
+        return projected
+
+    def _create_claim_form_extraction(self, params: dict[str, Any]) -> dict[str, Any]:
+        extraction = params["extraction"]
+        insured_id, patient_id = params.get("existing_insured_id"), params.get("existing_patient_id")
+        patients = self.tables.setdefault("Patient_Information", {})
+        other_insurance_id = None
+        if extraction.get("otherInsuranceInformation"):
+            other_insurance_id = self.insert("Other_Insurance_Information", extraction["otherInsuranceInformation"])["id"]
+            if insured_id in self.tables.get("Insured_Information", {}):
+                self.tables["Insured_Information"][insured_id]["other_identification_number"] = other_insurance_id
+        attestation_id = self.insert("Attestation", extraction.get("attestation", {}))["id"]
+        if insured_id is None:
+            insured_id = self.insert("Insured_Information", {
+                **extraction.get("insuredInformation", {}), "other_identification_number": other_insurance_id,
+            })["id"]
+        if patient_id is None:
+            patient_id = self.insert("Patient_Information", {
+                **extraction.get("patientInformation", {}), "insured_id": insured_id, "attestation_id": attestation_id,
+            })["id"]
+        elif patient_id in patients:
+            patients[patient_id].update({"attestation_id": attestation_id, "insured_id": insured_id})
+        return {"other_insurance_id": other_insurance_id, "insured_id": insured_id, "attestation_id": attestation_id, "patient_id": patient_id}
+
+    def _update_claims(self, params: dict[str, Any]) -> int:
+        claims = self.tables.setdefault("Claims", {})
+        updated = 0
+        for update in params["updates"]:
+            claim = claims.get(update["id"])
+            if claim is not None:
+                self.update("Claims", claim, {key: value for key, value in update.items() if value is not None})
+                updated += 1
+        return updated
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        parts = unquote(request.url.path).rstrip("/").split("/")
+        params = httpx.QueryParams(request.url.query.decode())
+        body = json.loads(request.content) if request.content else None
+        with self._lock:
+            if parts[-2] == "rpc":
+                handler = self.rpcs.get(parts[-1])
+                if handler is None:
+                    return httpx.Response(404, json={"message": f"Unknown function {parts[-1]}"})
+                return httpx.Response(200, json=handler(body or {}))
+
+            table = parts[-1]
+            if request.method in ("GET", "HEAD"):
+                return httpx.Response(200, json=self._select(table, params))
+            if request.method == "POST":
+                rows = body if isinstance(body, list) else [body]
+                conflict = params.get("on_conflict")
+                inserted = []
+                for row in rows:
+                    existing = None
+                    if conflict:
+                        existing = next((r for r in self.tables.get(table, {}).values() if r.get(conflict) == row.get(conflict)), None)
+                    if existing is not None:
+                        self.update(table, existing, row)
+                        inserted.append(existing)
+                    else:
+                        inserted.append(self.insert(table, row))
+                return httpx.Response(201, json=inserted)
+            if request.method == "PATCH":
+                rows = self._filtered(table, params)
+                for row in rows:
+                    self.update(table, row, body or {})
+                return httpx.Response(200, json=rows)
+            if request.method == "DELETE":
+                rows = self._filtered(table, params)
+                for row in rows:
+                    self.delete(table, row)
+                return httpx.Response(200, json=rows)
+        return httpx.Response(405)
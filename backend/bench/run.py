@@ -0,0 +1,243 @@
+"""
+Load test for the FastAPI backend against local stand-ins for LandingAI and Supabase.
+
+Run from backend/:
+
+    python -m bench.run --duration 30 --concurrency 32 \
+        --mix upload=1,create_claim=2,get_claim=4,list_claims=2,get_patient=1,analytics=1 \
+        --parse-latency 0.5 --extract-latency 0.5 --db-latency 0.002 \
+        --max-p95-ms get_claim=50 --json bench_output.json
+
+Requests go through the real app (middleware, routes, job queue, AsyncDatabase, caches)
+in-process via httpx's ASGI transport; only the LandingAI client and the PostgREST
+HTTP transport are replaced. Prints p50/p95/p99 latency and requests/second per
+operation, plus end-to-end upload pipeline latency, and exits non-zero when a
+--max-p95-ms budget or --max-error-rate is exceeded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Optional
+
+import httpx
+
+from bench.fakes import PAYERS, FakeLandingAIADE, FakePostgrest, fake_claim, fake_extraction
+
+OPERATIONS = ("upload", "upload_segmented", "create_claim", "get_claim", "list_claims", "get_patient", "analytics", "export")
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """ Nearest-rank percentile of already sorted values """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+def summarize(latencies: list[float], duration: float) -> dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "rps": len(latencies) / duration if duration > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def parse_pairs(value: str, cast=float) -> dict[str, Any]:
+    """ "a=1,b=2" -> {"a": 1.0, "b": 2.0} """
+    pairs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, number = item.partition("=")
+        pairs[name.strip()] = cast(number)
+    return pairs
+
+
+def load_app(args: argparse.Namespace):
+    """ Import the app with the fakes installed; returns (main module, fake PostgREST) """
+    os.environ.setdefault("SUPABASE_URL", "http://bench.invalid")
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ.setdefault("VISION_AGENT_API_KEY", "bench")
+    os.environ["CONTENT_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-cache-")
+    os.environ["DOCUMENT_STORE"] = "memory"
+    os.environ["PRICING_RELOAD_SECONDS"] = "0"
+    os.environ["MATCH_REFRESH_SECONDS"] = "0"
+    os.environ["VARIANCE_INTERVAL_SECONDS"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import database
+    postgrest = FakePostgrest(latency=args.db_latency)
+    # Keep the instrumented, pooled client; swap only the network transport underneath it
+    database.http_client._transport.transport = postgrest
+
+    import ingestion
+    ade = FakeLandingAIADE(args.parse_latency, args.extract_latency, seed=args.seed, members=args.members, pages=args.pages)
+    ingestion.get_client = lambda api_key: ade
+
+    import main
+    return main, postgrest
+
+
+def seed(postgrest: FakePostgrest, rng: random.Random, claims: int, members: int) -> tuple[list[int], list[int]]:
+    """ Preload patients (via the extraction RPC) and claims; returns their ids """
+    patient_ids = []
+    for _ in range(members):
+        ids = postgrest.rpcs["create_claim_form_extraction"]({"extraction": fake_extraction(rng, members)})
+        patient_ids.append(ids["patient_id"])
+    claim_ids = [postgrest.insert("Claims", fake_claim(rng, rng.choice(patient_ids)))["id"] for _ in range(claims)]
+    return claim_ids, patient_ids
+
+
+async def run(args: argparse.Namespace) -> int:
+    main, postgrest = load_app(args)
+    rng = random.Random(args.seed)
+    claim_ids, patient_ids = seed(postgrest, rng, args.seed_claims, args.seed_members)
+
+    mix = parse_pairs(args.mix)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+    operations, weights = zip(*mix.items())
+
+    latencies: dict[str, list[float]] = {operation: [] for operation in operations}
+    statuses: dict[str, Counter] = {operation: Counter() for operation in operations}
+    job_ids: list[str] = []
+    upload_payloads = [os.urandom(args.upload_bytes) for _ in range(max(1, args.distinct_uploads))] if args.distinct_uploads else None
+
+    def request_for(operation: str, worker_rng: random.Random) -> tuple[str, str, dict[str, Any]]:
+        if operation == "upload":
+            content = worker_rng.choice(upload_payloads) if upload_payloads else os.urandom(args.upload_bytes)
+            return "POST", "/upload", {"files": {"file": ("claim.pdf", content, "application/pdf")}}
+        if operation == "upload_segmented":
+            content = os.urandom(args.upload_bytes)
+            return "POST", "/upload", {"params": {"mode": "segmented"}, "files": {"file": ("claims.pdf", content, "application/pdf")}}
+        if operation == "create_claim":
+            return "POST", "/claims", {"json": fake_claim(worker_rng, worker_rng.choice(patient_ids) if patient_ids else None)}
+        if operation == "get_claim":
+            return "GET", f"/claims/{worker_rng.choice(claim_ids)}", {}
+        if operation == "list_claims":
+            return "GET", "/claims", {"params": {"limit": 100}}
+        if operation == "get_patient":
+            return "GET", f"/patient_information/{worker_rng.choice(patient_ids)}", {}
+        if operation == "export":
+            # One payer's claims with their patients embedded, streamed as NDJSON
+            return "GET", "/claims/export", {"params": {"include_patient": "true", "payer": worker_rng.choice(PAYERS)}}
+        return "GET", "/analytics", {}
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            started = time.perf_counter()
+            deadline = started + args.duration
+
+            async def worker(index: int):
+                worker_rng = random.Random(args.seed * 1000 + index)
+                while time.perf_counter() < deadline:
+                    operation = worker_rng.choices(operations, weights)[0]
+                    method, url, kwargs = request_for(operation, worker_rng)
+                    request_started = time.perf_counter()
+                    try:
+                        response = await client.request(method, url, **kwargs)
+                        status = response.status_code
+                    except Exception as e:
+                        status = type(e).__name__
+                        response = None
+                    latencies[operation].append(time.perf_counter() - request_started)
+                    statuses[operation][str(status)] += 1
+                    if operation.startswith("upload") and response is not None and response.status_code == 202:
+                        job_ids.append(response.json()["job_id"])
+
+            await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+
+            # Let queued uploads finish so the pipeline latency covers every accepted document
+            drain_deadline = time.perf_counter() + args.drain_timeout
+            while time.perf_counter() < drain_deadline:
+                jobs = [main.job_queue.get(job_id) for job_id in job_ids]
+                if all(job is None or job.finished_at is not None for job in jobs):
+                    break
+                await asyncio.sleep(0.1)
+
+    pipeline = [job.finished_at - job.created_at for job in (main.job_queue.get(job_id) for job_id in job_ids)
+                if job is not None and job.finished_at is not None and job.status == "succeeded"]
+    failed_jobs = sum(1 for job in (main.job_queue.get(job_id) for job_id in job_ids) if job is not None and job.status == "failed")
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "json"},
+        "elapsed_seconds": elapsed,
+        "total_rps": sum(len(values) for values in latencies.values()) / elapsed,
+        "operations": {
+            operation: {**summarize(latencies[operation], elapsed), "statuses": dict(statuses[operation])}
+            for operation in operations
+        },
+        "upload_pipeline": {**summarize(pipeline, elapsed), "failed": failed_jobs, "unfinished": len(job_ids) - len(pipeline) - failed_jobs},
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return check_budgets(report, parse_pairs(args.max_p95_ms), args.max_error_rate)
+
+
+def print_report(report: dict[str, Any]):
+    header = f"{'operation':<16}{'count':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  statuses"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["operations"].items()) + [("upload_pipeline", report["upload_pipeline"])]
+    for name, stats in rows:
+        extra = stats.get("statuses") or {"failed": stats.get("failed", 0), "unfinished": stats.get("unfinished", 0)}
+        print(f"{name:<16}{stats['count']:>8}{stats['rps']:>10.1f}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+              f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}  {extra}")
+    print(f"\n{report['total_rps']:.1f} requests/second over {report['elapsed_seconds']:.1f}s")
+
+
+def check_budgets(report: dict[str, Any], max_p95_ms: dict[str, float], max_error_rate: Optional[float]) -> int:
+    """ 1 if any operation is over its p95 budget or the error rate is too high """
+    failures = []
+    for name, budget in max_p95_ms.items():
+        stats = report["upload_pipeline"] if name == "upload_pipeline" else report["operations"].get(name)
+        if stats is not None and stats["p95_ms"] > budget:
+            failures.append(f"{name} p95 {stats['p95_ms']:.1f}ms > {budget:.1f}ms")
+    if max_error_rate is not None:
+        for name, stats in report["operations"].items():
+            errors = sum(count for status, count in stats["statuses"].items() if not status.startswith(("2", "3")))
+            if stats["count"] and errors / stats["count"] > max_error_rate:
+                failures.append(f"{name} error rate {errors / stats['count']:.2%} > {max_error_rate:.2%}")
+    for failure in failures:
+        print(f"BUDGET EXCEEDED: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to generate load")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--mix", default="upload=1,create_claim=2,get_claim=4,list_claims=2,get_patient=1,analytics=1",
+                        help=f"weighted operations, any of: {', '.join(OPERATIONS)}")
+    parser.add_argument("--parse-latency", type=float, default=0.5, help="fake LandingAI parse seconds")
+    parser.add_argument("--extract-latency", type=float, default=0.5, help="fake LandingAI extract seconds")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="fake PostgREST round-trip seconds")
+    parser.add_argument("--pages", type=int, default=10, help="claim forms (one per page) in each upload_segmented document")
+    parser.add_argument("--upload-bytes", type=int, default=200 * 1024, help="size of each uploaded document")
+    parser.add_argument("--distinct-uploads", type=int, default=0,
+                        help="reuse this many distinct documents (exercises the content cache); 0 = every upload unique")
+    parser.add_argument("--members", type=int, default=1000, help="distinct people in fake extractions")
+    parser.add_argument("--seed-claims", type=int, default=10000, help="claims preloaded before the run")
+    parser.add_argument("--seed-members", type=int, default=1000, help="patients preloaded before the run")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="seconds to wait for queued uploads after the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-p95-ms", default="", help="budgets such as get_claim=50,upload_pipeline=3000")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="fail when any operation's non-2xx/3xx share exceeds this")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
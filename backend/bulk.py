@@ -0,0 +1,95 @@
+""" Bulk ingestion helpers for JSON array and NDJSON request bodies """
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlmodel import SQLModel
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+async def iter_request_records(request: Request) -> AsyncIterator[tuple[int, Any]]:
+    """
+    Yield (index, record) pairs from a JSON array body or an NDJSON stream.
+    NDJSON is consumed incrementally; a line that is not valid JSON is yielded as a ValueError.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in NDJSON_MEDIA_TYPES:
+        try:
+            body = await request.json()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {str(e)}") from e
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of records")
+        for index, record in enumerate(body):
+            yield index, record
+        return
+
+    index = 0
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, _parse_ndjson_line(line)
+                index += 1
+    if buffer.strip():
+        yield index, _parse_ndjson_line(buffer)
+
+
+def _parse_ndjson_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {str(e)}")
+
+
+async def bulk_ingest(
+    records: AsyncIterator[tuple[int, Any]],
+    model: type[SQLModel],
+    insert_chunk: Callable[[list[tuple[int, SQLModel]], int], Awaitable[dict[str, Any]]],
+    chunk_size: int,
+) -> dict[str, Any]:
+    """
+    Validate records against model and insert the valid ones chunk by chunk.
+    Invalid rows and rows the database rejects are reported by index; the batch is never aborted.
+    """
+    received = 0
+    inserted = []
+    errors = []
+    chunk: list[tuple[int, SQLModel]] = []
+
+    async def flush():
+        result = await insert_chunk(chunk, chunk_size)
+        inserted.extend(result["inserted"])
+        errors.extend(result["errors"])
+        chunk.clear()
+
+    async for index, record in records:
+        received += 1
+        if isinstance(record, ValueError):
+            errors.append({"index": index, "error": str(record)})
+            continue
+        try:
+            chunk.append((index, model.model_validate(record)))
+        except ValidationError as e:
+            errors.append({"index": index, "error": e.errors(include_url=False, include_context=False)})
+            continue
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+
+    logger.info("Bulk %s: received %s, inserted %s, failed %s", model.__name__, received, len(inserted), len(errors))
+    return {
+        "received": received,
+        "inserted": len(inserted),
+        "failed": len(errors),
+        "ids": inserted,
+        "errors": sorted(errors, key=lambda error: error["index"]),
+    }
@@ -0,0 +1,208 @@
+""" Caches used by the backend """
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(*parts: bytes | str) -> str:
+    """ SHA-256 over one or more byte/str parts, separated so ("ab", "c") != ("a", "bc") """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """
+    Content-addressed on-disk store for JSON-serializable values.
+    Entries live in <directory>/<namespace>/<key>.json, expire after ttl_seconds
+    and are evicted least-recently-used once the store exceeds max_bytes.
+    """
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: float):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+        self._lock = threading.Lock()
+        # (namespace, key) -> (size, created_at), in least- to most-recently-used order
+        self._index: OrderedDict[tuple[str, str], tuple[int, float]] = OrderedDict()
+        self._total_bytes = 0
+        self._load_index()
+
+    def _path(self, namespace: str, key: str) -> Path:
+        return self.directory / namespace / f"{key}.json"
+
+    def _load_index(self):
+        """ Rebuild the index from disk, oldest files first """
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.parent.name, path.stem, stat.st_size))
+        for created_at, namespace, key, size in sorted(entries):
+            self._index[(namespace, key)] = (size, created_at)
+            self._total_bytes += size
+        if entries:
+            logger.info("Loaded %s cached entries (%s bytes) from %s", len(entries), self._total_bytes, self.directory)
+
+    def _remove(self, namespace: str, key: str):
+        """ Drop an entry from the index and disk; caller holds the lock """
+        size, _ = self._index.pop((namespace, key), (0, 0.0))
+        self._total_bytes -= size
+        try:
+            self._path(namespace, key).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Failed to delete cache entry %s/%s: %s", namespace, key, str(e))
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """ Return the cached value, or None on a miss """
+        with self._lock:
+            entry = self._index.get((namespace, key))
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._remove(namespace, key)
+                entry = None
+            if entry is None:
+                self.misses[namespace] = self.misses.get(namespace, 0) + 1
+                return None
+            self._index.move_to_end((namespace, key))
+        try:
+            with open(self._path(namespace, key), "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Discarding unreadable cache entry %s/%s: %s", namespace, key, str(e))
+            with self._lock:
+                self._remove(namespace, key)
+                self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            return None
+        with self._lock:
+            self.hits[namespace] = self.hits.get(namespace, 0) + 1
+        return value
+
+    def set(self, namespace: str, key: str, value: Any):
+        """ Store a value, evicting least-recently-used entries to stay under max_bytes """
+        data = json.dumps(value).encode("utf-8")
+        path = self._path(namespace, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            size, _ = self._index.pop((namespace, key), (0, 0.0))
+            self._total_bytes -= size
+            self._index[(namespace, key)] = (len(data), time.time())
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and len(self._index) > 1:
+                oldest_namespace, oldest_key = next(iter(self._index))
+                self._remove(oldest_namespace, oldest_key)
+
+    def stats(self) -> dict[str, Any]:
+        """ Hit/miss counters and current size """
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses)
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "namespaces": {
+                    namespace: {
+                        "hits": self.hits.get(namespace, 0),
+                        "misses": self.misses.get(namespace, 0),
+                    }
+                    for namespace in sorted(namespaces)
+                },
+            }
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL.
+    Keys are (namespace, key) pairs; hit/miss counters are kept per namespace.
+    Bounded by max_entries and, when given, by max_bytes of caller-reported entry sizes.
+    """
+    def __init__(self, max_entries: int, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+        self._lock = threading.Lock()
+        # (namespace, key) -> (expires_at, value, size), in least- to most-recently-used order
+        self._entries: OrderedDict[tuple[str, Any], tuple[float, Any, int]] = OrderedDict()
+        self._total_bytes = 0
+
+    def _pop(self, namespace: str, key: Any):
+        """ Drop an entry; caller holds the lock """
+        entry = self._entries.pop((namespace, key), None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        """ Return the cached value, or None on a miss """
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry[0] < time.monotonic():
+                self._pop(namespace, key)
+                entry = None
+            if entry is None:
+                self.misses[namespace] = self.misses.get(namespace, 0) + 1
+                return None
+            self._entries.move_to_end((namespace, key))
+            self.hits[namespace] = self.hits.get(namespace, 0) + 1
+            return entry[1]
+
+    def set(self, namespace: str, key: Any, value: Any, ttl_seconds: float, size: int = 0):
+        """
+        Store a value, evicting least-recently-used entries when full.
+        A value that can't be cached (no TTL, or larger than max_bytes) still drops the key's old value.
+        """
+        with self._lock:
+            self._pop(namespace, key)
+            if ttl_seconds <= 0 or self.max_entries <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+                return
+            self._entries[(namespace, key)] = (time.monotonic() + ttl_seconds, value, size)
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._total_bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def invalidate(self, namespace: str, key: Any):
+        """ Drop one entry """
+        with self._lock:
+            self._pop(namespace, key)
+
+    def clear(self):
+        """ Drop every entry """
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        """ Hit/miss counters and hit rate per namespace """
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses)
+            stats = {}
+            for namespace in sorted(namespaces):
+                hits = self.hits.get(namespace, 0)
+                misses = self.misses.get(namespace, 0)
+                stats[namespace] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "namespaces": stats,
+            }
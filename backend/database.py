@@ -1,13 +1,21 @@
 """ Database class """
 from __future__ import annotations
 
+import asyncio
+import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional
 
+import httpx
 from dotenv import load_dotenv
+from postgrest.exceptions import APIError
 from supabase import Client, create_client
+from supabase.lib.client_options import SyncClientOptions
 from sqlmodel import Field, SQLModel
 from enum import StrEnum
+from cache import TTLCache
+from metrics import InstrumentedTransport
 
 
 load_dotenv(override=True)
@@ -87,20 +95,96 @@ class ClaimBase(SQLModel):
     date_of_service: str = Field(..., description="The claim's date of service.")
     payer: str = Field(..., description="The claim's payer.")
     billed_amount: float = Field(..., description="The claim's billed amount.")
-    expected: float = Field(..., description="The claim's expected reimbursement.")
+    expected: Optional[float] = Field(default=None, description="The claim's expected reimbursement. Computed from the payer's pricing rules when omitted.")
     actual: Optional[float] = Field(default=None, description="The claim's actual reimbursement.")
     status: ClaimStatus = Field(..., description="The claim's status.")
     patient_id: Optional[int] = Field(default=None, description="The claim's patient id.")
+
+class ContractStatus(StrEnum):
+    """ Contract Status """
+    ACTIVE = "active"
+    PENDING = "pending"
+    EXPIRED = "expired"
+
+class ContractBase(SQLModel):
+    """ Contract """
+    payer_name: str = Field(..., description="The contract's payer name.")
+    contract_number: str = Field(..., description="The contract's number.")
+    effective_date: str = Field(..., description="The contract's effective date (YYYY-MM-DD).")
+    expiration_date: str = Field(..., description="The contract's expiration date (YYYY-MM-DD).")
+    status: ContractStatus = Field(default=ContractStatus.ACTIVE, description="The contract's status.")
+    document_url: Optional[str] = Field(default=None, description="The contract's document url.")
+
+class RateUnit(StrEnum):
+    """ Rate Unit """
+    FIXED = "fixed"
+    PERCENTAGE = "percentage"
+
+class PricingRuleBase(SQLModel):
+    """ Pricing Rule """
+    contract_id: int = Field(..., description="Foreign key reference to the contract.")
+    procedure_code: int = Field(..., description="The pricing rule's procedure code.")
+    procedure_name: Optional[str] = Field(default=None, description="The pricing rule's procedure name.")
+    reimbursement_rate: float = Field(..., description="Fixed amount, or percentage of the billed amount.")
+    unit: RateUnit = Field(..., description="Whether reimbursement_rate is a fixed amount or a percentage.")
+    notes: Optional[str] = Field(default=None, description="The pricing rule's notes.")
+
+class VarianceThresholdBase(SQLModel):
+    """ Variance Threshold """
+    payer: str = Field(..., description="The payer the threshold applies to, or '*' for every other payer.")
+    min_amount: float = Field(default=0, ge=0, description="Minimum underpayment (expected - actual) to flag.")
+    min_percent: float = Field(default=0, ge=0, description="Minimum underpayment as a percentage of expected to flag.")
     
 
 url: str = os.getenv("SUPABASE_URL")
 key: str = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+# Size of the keep-alive HTTP connection pool to PostgREST, and of the AsyncDatabase thread pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "32"))
+http_client = httpx.Client(
+    transport=InstrumentedTransport(httpx.HTTPTransport(
+        limits=httpx.Limits(max_connections=DB_POOL_SIZE, max_keepalive_connections=DB_POOL_SIZE, keepalive_expiry=60),
+    )),
+    timeout=httpx.Timeout(float(os.getenv("DB_TIMEOUT_SECONDS", "30"))),
+)
+supabase: Client = create_client(url, key, options=SyncClientOptions(httpx_client=http_client))
+
+# Seconds a by-id lookup stays in the read-through cache, per table
+ENTITY_CACHE_TTLS: dict[str, float] = {
+    table: float(os.getenv(f"ENTITY_CACHE_TTL_{table.upper()}", default))
+    for table, default in {
+        "Patient_Information": "300",
+        "Insured_Information": "300",
+        "Other_Insurance_Information": "300",
+        "Attestation": "3600",
+        "Claims": "30",
+    }.items()
+}
+
+
+def _quote_filter_value(value: str) -> str:
+    """ Double-quote a value inside a PostgREST or=(...) filter, so commas, dots and parens are literal """
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
 
 class Database:
     """ Database class """
-    def __init__(self):
+    def __init__(self, cache: Optional[TTLCache] = None):
         self.supabase = supabase
+        self.cache = cache if cache is not None else TTLCache(int(os.getenv("ENTITY_CACHE_SIZE", "10000")))
+
+    def _get_by_id(self, table: str, row_id: int):
+        """ Read-through lookup of one row by id; empty results are not cached """
+        cached = self.cache.get(table, row_id)
+        if cached is not None:
+            return cached
+        response = self.supabase.from_(table).select("*").eq("id", row_id).execute()
+        if response.data:
+            self.cache.set(table, row_id, response, ENTITY_CACHE_TTLS.get(table, 0))
+        return response
+
+    def invalidate(self, table: str, row_id: int):
+        """ Drop a cached row after it has been written """
+        self.cache.invalidate(table, row_id)
 
     def _to_insert_payload(self, obj: Any) -> Any:
         """
@@ -133,6 +217,166 @@ class Database:
         patient_information["attestation_id"] = attestation_id
         return self.supabase.from_("Patient_Information").insert(self._to_insert_payload(patient_information)).execute()
 
+    def create_claim_form_extraction(self, extraction: dict[str, Any], existing_insured_id: Optional[int] = None,
+                                     existing_patient_id: Optional[int] = None):
+        """
+        Create the other insurance, insured, attestation and patient rows of a claim form
+        in one round trip and one transaction (see sql/create_claim_form_extraction.sql).
+        Existing insured/patient ids are linked instead of inserting those people again; the form's
+        attestation and other insurance are always inserted and linked to them.
+        The response data is a dict of the ids.
+        """
+        payload = {
+            section: self._to_insert_payload(value)
+            for section, value in extraction.items()
+            if value is not None
+        }
+        response = None
+        try:
+            response = self.supabase.rpc("create_claim_form_extraction", {
+                "extraction": payload,
+                "existing_insured_id": existing_insured_id,
+                "existing_patient_id": existing_patient_id,
+            }).execute()
+            return response
+        finally:
+            # The matched patient and insured are relinked to the form's rows
+            insured_id = response.data.get("insured_id") if response is not None and response.data else existing_insured_id
+            if existing_patient_id is not None:
+                self.invalidate("Patient_Information", existing_patient_id)
+            if insured_id is not None:
+                self.invalidate("Insured_Information", insured_id)
+
+    # BULK INSERT Statements
+    @staticmethod
+    def _is_rejected(e: Exception) -> bool:
+        """
+        Whether PostgREST rejected the request's data (a 4xx): data exceptions (22xxx), constraint
+        violations (23xxx), raised exceptions (P0001) and request/schema errors (PGRST1xx/2xx).
+        Timeouts, connection errors and 5xx may have committed, so they are never retried.
+        """
+        if not isinstance(e, APIError):
+            return False
+        code = str(e.code or "")
+        if code.isdigit() and len(code) == 3:
+            # No JSON body: postgrest-py puts the HTTP status in code
+            return 400 <= int(code) < 500
+        return code.startswith(("22", "23", "P0001", "PGRST1", "PGRST2"))
+
+    def bulk_insert(self, table: str, rows: list[tuple[int, Any]], chunk_size: int = 500) -> dict[str, Any]:
+        """
+        Insert (index, row) pairs into a table with one multi-row insert per chunk.
+        A chunk PostgREST rejects is split in halves and retried, so one bad row only fails itself
+        at a cost of about log2(chunk_size) extra requests; any other failure fails the whole chunk.
+        Returns the inserted {"index", "id"} pairs and the per-row {"index", "error"} failures.
+        """
+        inserted = []
+        errors = []
+
+        def insert(chunk: list[tuple[int, Any]], payload: list[dict[str, Any]]):
+            try:
+                response = self.supabase.from_(table).insert(payload, default_to_null=False).execute()
+            except Exception as e:
+                if len(chunk) > 1 and self._is_rejected(e):
+                    middle = len(chunk) // 2
+                    insert(chunk[:middle], payload[:middle])
+                    insert(chunk[middle:], payload[middle:])
+                else:
+                    errors.extend({"index": index, "error": str(e)} for index, _ in chunk)
+                return
+            inserted.extend({"index": index, "id": data["id"]} for (index, _), data in zip(chunk, response.data))
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            insert(chunk, [self._to_insert_payload(row) for _, row in chunk])
+        return {"inserted": inserted, "errors": errors}
+
+    def bulk_create_patient_information(self, rows: list[tuple[int, PatientInformationBase]], chunk_size: int = 500):
+        """Create many patient information rows."""
+        return self.bulk_insert("Patient_Information", rows, chunk_size)
+
+    def bulk_create_insured_information(self, rows: list[tuple[int, InsuredInformationBase]], chunk_size: int = 500):
+        """Create many insured information rows."""
+        return self.bulk_insert("Insured_Information", rows, chunk_size)
+
+    def bulk_create_attestation(self, rows: list[tuple[int, AttestationBase]], chunk_size: int = 500):
+        """Create many attestations."""
+        return self.bulk_insert("Attestation", rows, chunk_size)
+
+    # PAGINATED SELECT Statements
+    def _select_page(
+        self,
+        table: str,
+        columns: Optional[list[str]] = None,
+        after: Optional[int] = None,
+        limit: int = 100,
+        eq: Optional[dict[str, Any]] = None,
+        gte: Optional[dict[str, Any]] = None,
+        lte: Optional[dict[str, Any]] = None,
+    ):
+        """
+        Keyset-paginated select ordered by id: returns up to `limit` rows with id > after.
+        Filters whose value is None are skipped.
+        """
+        query = self.supabase.from_(table).select(",".join(columns) if columns else "*")
+        for column, value in (eq or {}).items():
+            if value is not None:
+                query = query.eq(column, value)
+        for column, value in (gte or {}).items():
+            if value is not None:
+                query = query.gte(column, value)
+        for column, value in (lte or {}).items():
+            if value is not None:
+                query = query.lte(column, value)
+        if after is not None:
+            query = query.gt("id", after)
+        return query.order("id", desc=False).limit(limit).execute()
+
+    def get_patient_information_page(self, after: Optional[int] = None, limit: int = 100, columns: Optional[list[str]] = None,
+                                     insured_id: Optional[int] = None, patient_last_name: Optional[str] = None):
+        """ Get a page of patient information """
+        return self._select_page("Patient_Information", columns, after, limit,
+                                 eq={"insured_id": insured_id, "patient_last_name": patient_last_name})
+
+    def get_insured_information_page(self, after: Optional[int] = None, limit: int = 100, columns: Optional[list[str]] = None,
+                                     last_name: Optional[str] = None, identification_number: Optional[int] = None):
+        """ Get a page of insured information """
+        return self._select_page("Insured_Information", columns, after, limit,
+                                 eq={"last_name": last_name, "identification_number": identification_number})
+
+    def get_other_insurance_information_page(self, after: Optional[int] = None, limit: int = 100, columns: Optional[list[str]] = None):
+        """ Get a page of other insurance information """
+        return self._select_page("Other_Insurance_Information", columns, after, limit)
+
+    def get_attestation_page(self, after: Optional[int] = None, limit: int = 100, columns: Optional[list[str]] = None):
+        """ Get a page of attestations """
+        return self._select_page("Attestation", columns, after, limit)
+
+    def get_claims_page(self, after: Optional[int] = None, limit: int = 100, columns: Optional[list[str]] = None,
+                        status: Optional[ClaimStatus] = None, payer: Optional[str] = None, patient_id: Optional[int] = None,
+                        date_from: Optional[str] = None, date_to: Optional[str] = None):
+        """ Get a page of claims """
+        return self._select_page("Claims", columns, after, limit,
+                                 eq={"status": status, "payer": payer, "patient_id": patient_id},
+                                 gte={"date_of_service": date_from},
+                                 lte={"date_of_service": date_to})
+
+    def get_changed_claims_page(self, after: Optional[int] = None, limit: int = 100, columns: Optional[list[str]] = None,
+                                updated_from: Optional[str] = None, updated_to: Optional[str] = None):
+        """ Get a page of claims whose updated_at is within [updated_from, updated_to] """
+        return self._select_page("Claims", columns, after, limit,
+                                 gte={"updated_at": updated_from},
+                                 lte={"updated_at": updated_to})
+
+    def get_claim_variances_page(self, after: Optional[int] = None, limit: int = 100, columns: Optional[list[str]] = None,
+                                 payer: Optional[str] = None, min_variance: Optional[float] = None,
+                                 date_from: Optional[str] = None, date_to: Optional[str] = None):
+        """ Get a page of flagged underpayments """
+        return self._select_page("Claim_Variances", columns, after, limit,
+                                 eq={"payer": payer},
+                                 gte={"variance": min_variance, "date_of_service": date_from},
+                                 lte={"date_of_service": date_to})
+
     # SELECT Statements
     def get_all_patient_information(self):
         """ Get all patient information """
@@ -140,7 +384,7 @@ class Database:
 
     def get_patient_information(self, patient_id: int):
         """Get a patient information by id."""
-        return self.supabase.from_("Patient_Information").select("*").eq("id", patient_id).execute()
+        return self._get_by_id("Patient_Information", patient_id)
     
     def get_all_patient_information_by_patient_last_name(self, patient_last_name: str):
         """ Get all patient information by patient last name """
@@ -156,7 +400,7 @@ class Database:
     
     def get_insured_information(self, insured_id: int):
         """Get an insured information by id."""
-        return self.supabase.from_("Insured_Information").select("*").eq("id", insured_id).execute()
+        return self._get_by_id("Insured_Information", insured_id)
     
     def get_all_insured_information_by_last_name(self, last_name: str):
         """ Get all insured information by last name """
@@ -172,7 +416,7 @@ class Database:
     
     def get_other_insurance_information(self, other_insurance_id: int):
         """Get other insurance information by id."""
-        return self.supabase.from_("Other_Insurance_Information").select("*").eq("id", other_insurance_id).execute()
+        return self._get_by_id("Other_Insurance_Information", other_insurance_id)
     
     def get_all_other_insurance_information_by_policy_holder_last_name(self, policy_holder_last_name: str):
         """ Get all other insurance information by policy holder insurance last name """
@@ -184,53 +428,242 @@ class Database:
     
     def get_attestation(self, attestation_id: int):
         """Get an attestation by id."""
-        return self.supabase.from_("Attestation").select("*").eq("id", attestation_id).execute()
+        return self._get_by_id("Attestation", attestation_id)
 
     # UPDATE Statements
 
     def update_patient_information(self, patient_id: int, patient_information: PatientInformationBase):
         """Update a patient information."""
-        return self.supabase.from_("Patient_Information").update(patient_information).eq("id", patient_id).execute()
+        try:
+            return self.supabase.from_("Patient_Information").update(patient_information).eq("id", patient_id).execute()
+        finally:
+            self.invalidate("Patient_Information", patient_id)
 
     def update_insured_information(self, insured_id: int, insured_information: InsuredInformationBase):
         """Update an insured information."""
-        return self.supabase.from_("Insured_Information").update(insured_information).eq("id", insured_id).execute()
+        try:
+            return self.supabase.from_("Insured_Information").update(insured_information).eq("id", insured_id).execute()
+        finally:
+            self.invalidate("Insured_Information", insured_id)
     
     def update_other_insurance_information(self, other_insurance_id: int, other_insurance_information: OtherInsuranceInformationBase):
         """Update other insurance information."""
-        return self.supabase.from_("Other_Insurance_Information").update(other_insurance_information).eq("id", other_insurance_id).execute()
+        try:
+            return self.supabase.from_("Other_Insurance_Information").update(other_insurance_information).eq("id", other_insurance_id).execute()
+        finally:
+            self.invalidate("Other_Insurance_Information", other_insurance_id)
 
     def update_attestation(self, attestation_id: int, attestation: AttestationBase):
         """Update an attestation."""
-        return self.supabase.from_("Attestation").update(attestation).eq("id", attestation_id).execute()
+        try:
+            return self.supabase.from_("Attestation").update(attestation).eq("id", attestation_id).execute()
+        finally:
+            self.invalidate("Attestation", attestation_id)
 
     # DELETE Statements
     
     def delete_patient_information(self, patient_id: int):
         """Delete a patient information."""
-        return self.supabase.from_("Patient_Information").delete().eq("id", patient_id).execute()
+        try:
+            return self.supabase.from_("Patient_Information").delete().eq("id", patient_id).execute()
+        finally:
+            self.invalidate("Patient_Information", patient_id)
 
     def delete_insured_information(self, insured_id: int):
         """ Delete an insured information """
-        return self.supabase.from_("Insured_Information").delete().eq("id", insured_id).execute()
+        try:
+            return self.supabase.from_("Insured_Information").delete().eq("id", insured_id).execute()
+        finally:
+            self.invalidate("Insured_Information", insured_id)
 
     def delete_other_insurance_information(self, other_insurance_id: int):
         """ Delete other insurance information """
-        return self.supabase.from_("Other_Insurance_Information").delete().eq("id", other_insurance_id).execute()
+        try:
+            return self.supabase.from_("Other_Insurance_Information").delete().eq("id", other_insurance_id).execute()
+        finally:
+            self.invalidate("Other_Insurance_Information", other_insurance_id)
 
     def delete_attestation(self, attestation_id: int):
         """ Delete an attestation """
-        return self.supabase.from_("Attestation").delete().eq("id", attestation_id).execute()
+        try:
+            return self.supabase.from_("Attestation").delete().eq("id", attestation_id).execute()
+        finally:
+            self.invalidate("Attestation", attestation_id)
 
   # Claims Statements
     def create_claim(self, claim: ClaimBase):
         """Create a new claim."""
         return self.supabase.from_("Claims").insert(self._to_insert_payload(claim)).execute()
     
+    def bulk_create_claims(self, rows: list[tuple[int, ClaimBase]], chunk_size: int = 500):
+        """Create many claims."""
+        return self.bulk_insert("Claims", rows, chunk_size)
+
     def get_all_claims(self):
         """Get all claims."""
         return self.supabase.from_("Claims").select("*").order("claim_id", desc=False).execute()
     
+    def get_claims_by_claim_ids(self, claim_ids: list[str], columns: Optional[list[str]] = None,
+                                chunk_size: int = 200) -> list[dict[str, Any]]:
+        """Get the claims with any of the given claim_ids (uses the claims_claim_id index)."""
+        claims = []
+        # Ids travel in the query string, so keep each request's URL short
+        for start in range(0, len(claim_ids), chunk_size):
+            chunk = claim_ids[start:start + chunk_size]
+            query = self.supabase.from_("Claims").select(",".join(columns) if columns else "*")
+            claims.extend(query.in_("claim_id", chunk).execute().data)
+        return claims
+
+    def bulk_update_claims(self, updates: list[dict[str, Any]], chunk_size: int = 1000) -> int:
+        """
+        Apply {"id", "expected"?, "actual"?, "status"?} updates with one statement per chunk
+        (see sql/update_claims.sql). Returns the number of claims updated.
+        """
+        updated = 0
+        for start in range(0, len(updates), chunk_size):
+            chunk = updates[start:start + chunk_size]
+            try:
+                updated += self.supabase.rpc("update_claims", {"updates": chunk}).execute().data
+            finally:
+                for update in chunk:
+                    self.invalidate("Claims", update["id"])
+        return updated
+
+    def get_claim_rollups_page(self, after: Optional[tuple[str, str]] = None, limit: int = 1000, payer: Optional[str] = None,
+                               month_from: Optional[str] = None, month_to: Optional[str] = None):
+        """
+        Get a page of the per payer/month claim aggregates (see sql/claim_rollups.sql).
+        Keyset-paginated on the (payer, month) primary key: returns rows after the given pair.
+        """
+        query = self.supabase.from_("Claim_Rollups").select("*")
+        if payer is not None:
+            query = query.eq("payer", payer)
+        if month_from is not None:
+            query = query.gte("month", month_from)
+        if month_to is not None:
+            query = query.lte("month", month_to)
+        if after is not None:
+            after_payer, after_month = _quote_filter_value(after[0]), _quote_filter_value(after[1])
+            query = query.or_(f"payer.gt.{after_payer},and(payer.eq.{after_payer},month.gt.{after_month})")
+        return query.order("payer").order("month").limit(limit).execute()
+
+    def get_claim_rollups(self, payer: Optional[str] = None, month_from: Optional[str] = None, month_to: Optional[str] = None,
+                          page_size: int = 1000) -> list[dict[str, Any]]:
+        """
+        Get every per payer/month claim aggregate matching the filters, page by page.
+        Only an empty page ends the read: PostgREST caps each response at its max-rows setting.
+        """
+        rows = []
+        after = None
+        while True:
+            page = self.get_claim_rollups_page(after, page_size, payer, month_from, month_to).data
+            if not page:
+                return rows
+            rows.extend(page)
+            after = (page[-1]["payer"], page[-1]["month"])
+
     def get_claim(self, claim_id: int):
         """Get a claim by id."""
-        return self.supabase.from_("Claims").select("*").eq("id", claim_id).execute()
\ No newline at end of file
+        return self._get_by_id("Claims", claim_id)
+
+
+  # Contract and Pricing Rule Statements
+    def create_contract(self, contract: ContractBase):
+        """Create a new contract."""
+        return self.supabase.from_("Contracts").insert(self._to_insert_payload(contract)).execute()
+
+    def get_all_contracts(self):
+        """Get all contracts."""
+        return self.supabase.from_("Contracts").select("*").order("id", desc=False).execute()
+
+    def get_contracts_page(self, after: Optional[int] = None, limit: int = 1000):
+        """ Get a page of contracts """
+        return self._select_page("Contracts", None, after, limit)
+
+    def create_pricing_rule(self, pricing_rule: PricingRuleBase):
+        """Create a new pricing rule."""
+        return self.supabase.from_("Pricing_Rules").insert(self._to_insert_payload(pricing_rule)).execute()
+
+    def get_all_pricing_rules(self, contract_id: Optional[int] = None):
+        """Get all pricing rules, optionally for one contract."""
+        query = self.supabase.from_("Pricing_Rules").select("*")
+        if contract_id is not None:
+            query = query.eq("contract_id", contract_id)
+        return query.order("id", desc=False).execute()
+
+    def get_pricing_rules_page(self, after: Optional[int] = None, limit: int = 1000):
+        """ Get a page of pricing rules """
+        return self._select_page("Pricing_Rules", None, after, limit)
+
+    def get_pricing_rules_version(self) -> str:
+        """Get a token that changes whenever any contract or pricing rule changes."""
+        return self.supabase.rpc("pricing_rules_version", {}).execute().data
+
+  # Variance Statements
+    def get_variance_thresholds(self):
+        """Get all variance thresholds."""
+        return self.supabase.from_("Variance_Thresholds").select("*").execute()
+
+    def upsert_variance_threshold(self, threshold: VarianceThresholdBase):
+        """Create or replace the variance threshold for a payer."""
+        return self.supabase.from_("Variance_Thresholds").upsert(self._to_insert_payload(threshold), on_conflict="payer").execute()
+
+    def delete_variance_threshold(self, payer: str):
+        """Delete the variance threshold for a payer."""
+        return self.supabase.from_("Variance_Thresholds").delete().eq("payer", payer).execute()
+
+    def upsert_claim_variances(self, variances: list[dict[str, Any]]):
+        """Create or replace flagged underpayments."""
+        return self.supabase.from_("Claim_Variances").upsert(variances, on_conflict="id").execute()
+
+    def delete_claim_variances(self, claim_ids: list[int], chunk_size: int = 500) -> int:
+        """Delete flagged underpayments for claims that are no longer underpaid; returns how many were deleted."""
+        deleted = 0
+        # Ids travel in the query string, so keep each request's URL short
+        for start in range(0, len(claim_ids), chunk_size):
+            chunk = claim_ids[start:start + chunk_size]
+            deleted += len(self.supabase.from_("Claim_Variances").delete().in_("id", chunk).execute().data)
+        return deleted
+
+    def get_variance_summary(self, payer: Optional[str] = None):
+        """Get the per payer underpayment totals."""
+        query = self.supabase.from_("Variance_Summary").select("*")
+        if payer is not None:
+            query = query.eq("payer", payer)
+        return query.order("variance_amount", desc=True).execute()
+
+    def get_last_variance_run(self):
+        """Get the most recent variance run, if any."""
+        return self.supabase.from_("Variance_Runs").select("*").order("id", desc=True).limit(1).execute()
+
+    def create_variance_run(self, run: dict[str, Any]):
+        """Record a finished variance run."""
+        return self.supabase.from_("Variance_Runs").insert(run).execute()
+
+class AsyncDatabase:
+    """
+    Awaitable facade over Database for async route handlers.
+    Every Database method is exposed as a coroutine that runs on a thread pool sized
+    like the HTTP connection pool, so queries never block the event loop and never
+    wait on a connection. Caching, bulk and pagination logic stay in Database.
+    """
+    def __init__(self, database: Database, max_workers: int = DB_POOL_SIZE):
+        self.database = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.database, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+
+        setattr(self, name, call)
+        return call
+
+    def close(self):
+        """ Stop the thread pool """
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,201 @@
+""" Per-tenant store of processed uploads (markdown, extraction, inserted ids) keyed by upload id """
+import json
+import logging
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Optional
+
+from cache import TTLCache, content_hash
+
+try:
+    import redis
+except ImportError:  # Only needed for DOCUMENT_STORE=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+TENANT_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def valid_tenant(tenant: str) -> bool:
+    return bool(TENANT_PATTERN.match(tenant))
+
+
+class DocumentStore(ABC):
+    """ Keyed by (tenant, upload id); records are JSON-serializable dicts and expire after ttl_seconds """
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def get(self, tenant: str, upload_id: str) -> Optional[dict[str, Any]]:
+        """ Return the record, or None if missing or expired """
+
+    @abstractmethod
+    def set(self, tenant: str, upload_id: str, record: dict[str, Any]):
+        """ Store or replace a record """
+
+    @abstractmethod
+    def delete(self, tenant: str, upload_id: str) -> bool:
+        """ Delete a record; returns whether it existed """
+
+    @abstractmethod
+    def stats(self) -> dict[str, Any]:
+        """ Backend and size information """
+
+
+class MemoryDocumentStore(DocumentStore):
+    """ Process-local LRU bounded by entries and bytes; only safe with a single worker """
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int):
+        super().__init__(ttl_seconds)
+        self._cache = TTLCache(max_entries, max_bytes)
+
+    def get(self, tenant: str, upload_id: str) -> Optional[dict[str, Any]]:
+        return self._cache.get(tenant, upload_id)
+
+    def set(self, tenant: str, upload_id: str, record: dict[str, Any]):
+        size = len(json.dumps(record, default=str))
+        if self._cache.max_bytes is not None and size > self._cache.max_bytes and "markdown" in record:
+            # Keep the status and extraction of a large document; its markdown is the bulk of it
+            record = {key: value for key, value in record.items() if key != "markdown"}
+            size = len(json.dumps(record, default=str))
+        if self._cache.max_bytes is not None and size > self._cache.max_bytes:
+            logger.warning("Document %s/%s is %s bytes, over the %s byte store limit; not kept",
+                           tenant, upload_id, size, self._cache.max_bytes)
+        self._cache.set(tenant, upload_id, record, self.ttl_seconds, size)
+
+    def delete(self, tenant: str, upload_id: str) -> bool:
+        existed = self._cache.get(tenant, upload_id) is not None
+        self._cache.invalidate(tenant, upload_id)
+        return existed
+
+    def stats(self) -> dict[str, Any]:
+        stats = self._cache.stats()
+        return {"backend": "memory", "entries": stats["entries"], "bytes": stats["bytes"], "max_bytes": stats["max_bytes"]}
+
+
+class DiskDocumentStore(DocumentStore):
+    """
+    One JSON file per record under <directory>/<tenant hash>/, shared by every worker on the host.
+    Reads go straight to the file (no per-process index), expired files are ignored, and the
+    oldest files are swept once the directory exceeds max_bytes.
+    """
+    SWEEP_EVERY = 100
+
+    def __init__(self, ttl_seconds: float, directory: str, max_bytes: int):
+        super().__init__(ttl_seconds)
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _path(self, tenant: str, upload_id: str) -> Path:
+        # Hash both parts so neither can escape the directory
+        return self.directory / content_hash(tenant)[:32] / f"{content_hash(upload_id)[:32]}.json"
+
+    def get(self, tenant: str, upload_id: str) -> Optional[dict[str, Any]]:
+        path = self._path(tenant, upload_id)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Discarding unreadable document %s/%s: %s", tenant, upload_id, str(e))
+            return None
+
+    def set(self, tenant: str, upload_id: str, record: dict[str, Any]):
+        path = self._path(tenant, upload_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, default=str)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % self.SWEEP_EVERY == 0
+        if sweep:
+            self.sweep()
+
+    def delete(self, tenant: str, upload_id: str) -> bool:
+        try:
+            self._path(tenant, upload_id).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _files(self) -> list[tuple[float, int, Path]]:
+        files = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def sweep(self):
+        """ Delete expired files, then the oldest ones until under max_bytes """
+        now = time.time()
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if now - mtime <= self.ttl_seconds and total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> dict[str, Any]:
+        files = self._files()
+        return {"backend": "disk", "entries": len(files), "bytes": sum(size for _, size, _ in files), "max_bytes": self.max_bytes}
+
+
+class RedisDocumentStore(DocumentStore):
+    """
+    Records in Redis (or any server speaking its protocol) with a per-key TTL, shared by every
+    worker and host. Memory is bounded by the server's maxmemory / eviction policy.
+    """
+    def __init__(self, ttl_seconds: float, url: str, prefix: str = "documents"):
+        super().__init__(ttl_seconds)
+        if redis is None:
+            raise RuntimeError("DOCUMENT_STORE=redis requires the redis package to be installed")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, tenant: str, upload_id: str) -> str:
+        return f"{self.prefix}:{tenant}:{upload_id}"
+
+    def get(self, tenant: str, upload_id: str) -> Optional[dict[str, Any]]:
+        value = self.client.get(self._key(tenant, upload_id))
+        return json.loads(value) if value is not None else None
+
+    def set(self, tenant: str, upload_id: str, record: dict[str, Any]):
+        self.client.set(self._key(tenant, upload_id), json.dumps(record, default=str), ex=max(1, int(self.ttl_seconds)))
+
+    def delete(self, tenant: str, upload_id: str) -> bool:
+        return bool(self.client.delete(self._key(tenant, upload_id)))
+
+    def stats(self) -> dict[str, Any]:
+        memory = self.client.info("memory")
+        return {"backend": "redis", "used_memory": memory.get("used_memory"), "maxmemory": memory.get("maxmemory")}
+
+
+def create_document_store() -> DocumentStore:
+    """ Build the store selected by DOCUMENT_STORE (memory, disk or redis) """
+    backend = os.getenv("DOCUMENT_STORE", "memory").lower()
+    ttl_seconds = float(os.getenv("DOCUMENT_STORE_TTL_SECONDS", str(24 * 60 * 60)))
+    max_bytes = int(os.getenv("DOCUMENT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+    if backend == "memory":
+        return MemoryDocumentStore(ttl_seconds, int(os.getenv("DOCUMENT_STORE_MAX_ENTRIES", "1000")), max_bytes)
+    if backend == "disk":
+        return DiskDocumentStore(ttl_seconds, os.getenv("DOCUMENT_STORE_DIR", "extracts/documents"), max_bytes)
+    if backend == "redis":
+        return RedisDocumentStore(ttl_seconds, os.getenv("DOCUMENT_STORE_URL", "redis://localhost:6379/0"))
+    raise ValueError(f"Unknown DOCUMENT_STORE {backend!r}; expected memory, disk or redis")
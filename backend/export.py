@@ -0,0 +1,155 @@
+""" Streaming export of claims as NDJSON, CSV or Parquet """
+import csv
+import io
+import json
+from enum import StrEnum
+from typing import Any, Iterator, Optional, get_args
+
+from database import Database, ClaimBase, ClaimStatus, PatientInformationBase
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+PATIENT_PREFIX = "patient_information."
+
+
+class ExportFormat(StrEnum):
+    """ Export Format """
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+def iter_claim_rows(
+    database: Database,
+    page_size: int,
+    after: Optional[int] = None,
+    include_patient: bool = False,
+    status: Optional[ClaimStatus] = None,
+    payer: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    Page through Claims by id and yield one list of flat rows per page.
+    Only one page is held in memory at a time.
+    """
+    columns = ["*", "patient_information:Patient_Information(*)"] if include_patient else None
+    while True:
+        # Only an empty page ends the export: PostgREST caps responses at max-rows, below page_size
+        rows = database.get_claims_page(after, page_size, columns, status, payer, None, date_from, date_to).data
+        if not rows:
+            return
+        after = rows[-1]["id"]
+        yield [_flatten(row, include_patient) for row in rows]
+
+
+def _flatten(row: dict[str, Any], include_patient: bool) -> dict[str, Any]:
+    """ Inline the embedded patient record as patient_information.<column> """
+    if not include_patient:
+        return row
+    patient = row.pop("patient_information", None) or {}
+    row[f"{PATIENT_PREFIX}id"] = patient.get("id")
+    for field in PatientInformationBase.model_fields:
+        row[f"{PATIENT_PREFIX}{field}"] = patient.get(field)
+    return row
+
+
+def stream_ndjson(pages: Iterator[list[dict[str, Any]]]) -> Iterator[str]:
+    """ One JSON object per line """
+    for rows in pages:
+        yield "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+
+def stream_csv(pages: Iterator[list[dict[str, Any]]]) -> Iterator[str]:
+    """ CSV with a header taken from the first page """
+    buffer = io.StringIO()
+    writer = None
+    for rows in pages:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0]), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+class _ChunkSink(io.RawIOBase):
+    """ Write-only file that hands bytes back to the caller instead of keeping them """
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        """ Return and forget everything written since the last drain """
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_type(column: str):
+    """ Arrow type for a claim or patient column; unknown columns are exported as strings """
+    name = column.removeprefix(PATIENT_PREFIX)
+    model = PatientInformationBase if column.startswith(PATIENT_PREFIX) else ClaimBase
+    if name == "id":
+        return pyarrow.int64()
+    field = model.model_fields.get(name)
+    annotation = field.annotation if field else str
+    annotation = next((arg for arg in get_args(annotation) if arg is not type(None)), annotation)
+    if annotation is bool:
+        return pyarrow.bool_()
+    if annotation is int:
+        return pyarrow.int64()
+    if annotation is float:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def stream_parquet(pages: Iterator[list[dict[str, Any]]]) -> Iterator[bytes]:
+    """ Parquet with one row group per page """
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    for rows in pages:
+        if writer is None:
+            schema = pyarrow.schema([(column, _arrow_type(column)) for column in rows[0]])
+            writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        string_columns = {field.name for field in schema if field.type == pyarrow.string()}
+        normalized = [
+            {
+                column: str(row.get(column)) if column in string_columns and row.get(column) is not None else row.get(column)
+                for column in schema.names
+            }
+            for row in rows
+        ]
+        writer.write_table(pyarrow.Table.from_pylist(normalized, schema=schema))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
@@ -0,0 +1,296 @@
+""" Document ingestion pipeline: parse -> extract -> insert """
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from enum import StrEnum
+
+from typing import Any, Optional
+
+from pydantic import BaseModel, Field
+from landingai_ade import APIConnectionError, APIStatusError, LandingAIADE, RateLimitError
+from landingai_ade.lib import pydantic_to_json_schema
+from cache import ContentCache, content_hash
+from database import (Database, InsuredInformationBase,
+PatientInformationBase, OtherInsuranceInformationBase, AttestationBase
+)
+from matching import MemberMatcher
+from metrics import LANDINGAI_CIRCUIT_OPEN, track_stage
+from resilience import CircuitBreaker, ServiceGuard, TokenBucket
+from segments import Page, Segment, pages_from_splits, split_forms
+from uploads import SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+
+# Build a single extraction schema that includes ALL sections we want LandingAI to extract.
+class ClaimFormExtractionSchema(BaseModel):
+    """ Claim Form Extraction Schema """
+    insuredInformation: InsuredInformationBase = Field(..., description="The insured information.")
+    patientInformation: PatientInformationBase = Field(..., description="The patient information.")
+    otherInsuranceInformation: Optional[OtherInsuranceInformationBase] = Field(..., description="The other insurance information.")
+    attestation: AttestationBase = Field(..., description="The attestation.")
+
+
+CLAIM_FORM_SCHEMA = pydantic_to_json_schema(ClaimFormExtractionSchema)
+
+PARSE_NAMESPACE = "parse"
+PARSE_PAGES_NAMESPACE = "parse_pages"
+EXTRACT_NAMESPACE = "extract"
+# Forms of one segmented document extracted at once; LandingAI's rate limiter still applies across all of them
+SEGMENT_CONCURRENCY = int(os.getenv("SEGMENT_CONCURRENCY", "4"))
+
+
+class UploadMode(StrEnum):
+    """ single: the whole document is one claim form; segmented: it holds many, split by page """
+    SINGLE = "single"
+    SEGMENTED = "segmented"
+
+
+class IngestionError(Exception):
+    """ Raised when a document cannot be ingested """
+
+
+# Per-call timeouts; retries are ours (below), so the SDK's own retries are disabled
+PARSE_TIMEOUT_SECONDS = float(os.getenv("LANDINGAI_PARSE_TIMEOUT_SECONDS", "300"))
+EXTRACT_TIMEOUT_SECONDS = float(os.getenv("LANDINGAI_EXTRACT_TIMEOUT_SECONDS", "120"))
+TRANSIENT_STATUS_CODES = {408, 409, 429}
+
+
+def is_transient(e: Exception) -> bool:
+    """ Whether a LandingAI error is worth retrying: throttling, timeouts, connection errors and 5xx """
+    if isinstance(e, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(e, APIStatusError) and (e.status_code in TRANSIENT_STATUS_CODES or e.status_code >= 500)
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    """ Seconds from a Retry-After header on a LandingAI error response """
+    response = getattr(e, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+# One guard per process: the token bucket should be sized to our LandingAI quota divided by the
+# number of worker processes, since each process refills its own bucket
+landingai = ServiceGuard(
+    "LandingAI",
+    TokenBucket(float(os.getenv("LANDINGAI_RATE_PER_SECOND", "10")), float(os.getenv("LANDINGAI_BURST", "20"))),
+    CircuitBreaker("LandingAI", int(os.getenv("LANDINGAI_FAILURE_THRESHOLD", "5")), float(os.getenv("LANDINGAI_RESET_SECONDS", "30"))),
+    is_transient,
+    retry_after,
+    max_retries=int(os.getenv("LANDINGAI_MAX_RETRIES", "4")),
+    base_delay=float(os.getenv("LANDINGAI_RETRY_BASE_SECONDS", "0.5")),
+    max_delay=float(os.getenv("LANDINGAI_RETRY_MAX_SECONDS", "30")),
+    max_rate_wait=float(os.getenv("LANDINGAI_MAX_RATE_WAIT_SECONDS", "60")),
+)
+LANDINGAI_CIRCUIT_OPEN.set_function(lambda: float(landingai.breaker.is_open()))
+
+_clients: dict[str, LandingAIADE] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: str) -> LandingAIADE:
+    """ Get the shared LandingAI ADE client for an API key, keeping its connection pool alive across uploads """
+    client = _clients.get(api_key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            try:
+                client = LandingAIADE(apikey=api_key, max_retries=0, timeout=max(PARSE_TIMEOUT_SECONDS, EXTRACT_TIMEOUT_SECONDS))
+            except Exception as e:
+                raise IngestionError(f"Failed to initialize document parser: {str(e)}") from e
+            _clients[api_key] = client
+    return client
+
+
+def close_clients():
+    """ Close the shared LandingAI clients' connection pools """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning("Failed to close LandingAI client: %s", str(e))
+
+
+def extract_key(markdown_content: str) -> str:
+    """ Cache key for an extraction: markdown plus the schema it was extracted with """
+    return content_hash(markdown_content, CLAIM_FORM_SCHEMA)
+
+
+def parse_document(client: LandingAIADE, cache: ContentCache, document: SpooledUpload) -> str:
+    """ Parse a document into markdown, reusing a cached parse of identical bytes """
+    cached = cache.get(PARSE_NAMESPACE, document.sha256)
+    if cached is not None:
+        logger.info("Parse cache hit for %s (%s)", document.filename, document.sha256)
+        return cached
+
+    def parse():
+        # The spooled upload is streamed to the parser as-is: no extra copy in memory or on disk.
+        # Rewind on every attempt since a failed one may have read part of it
+        document.seek(0)
+        return client.parse(document=document, timeout=PARSE_TIMEOUT_SECONDS)
+
+    parse_response = landingai.call("parse", parse)
+    if not hasattr(parse_response, 'markdown'):
+        logger.error("Response object missing 'markdown' attribute. Available attributes: %s", dir(parse_response))
+        raise IngestionError("Parser response missing expected 'markdown' attribute")
+    markdown_content = parse_response.markdown
+    cache.set(PARSE_NAMESPACE, document.sha256, markdown_content)
+    return markdown_content
+
+
+def parse_pages(client: LandingAIADE, cache: ContentCache, document: SpooledUpload) -> list[Page]:
+    """ Parse a document into per-page markdown, reusing a cached parse of identical bytes """
+    cached = cache.get(PARSE_PAGES_NAMESPACE, document.sha256)
+    if cached is not None:
+        logger.info("Page parse cache hit for %s (%s)", document.filename, document.sha256)
+        return [Page(**page) for page in cached]
+
+    def parse():
+        document.seek(0)
+        return client.parse(document=document, split="page", timeout=PARSE_TIMEOUT_SECONDS)
+
+    parse_response = landingai.call("parse", parse)
+    if getattr(parse_response, "splits", None):
+        pages = pages_from_splits(parse_response.splits)
+    elif hasattr(parse_response, "markdown"):
+        pages = [Page(number=0, markdown=parse_response.markdown)]
+    else:
+        logger.error("Response object missing 'splits' and 'markdown'. Available attributes: %s", dir(parse_response))
+        raise IngestionError("Parser response missing expected 'splits' attribute")
+    cache.set(PARSE_PAGES_NAMESPACE, document.sha256, [asdict(page) for page in pages])
+    return pages
+
+
+def extract_claim_form(client: LandingAIADE, cache: ContentCache, markdown_content: str) -> dict[str, Any]:
+    """ Extract the claim form sections from parsed markdown, reusing a cached extraction """
+    key = extract_key(markdown_content)
+    cached = cache.get(EXTRACT_NAMESPACE, key)
+    if cached is not None:
+        logger.info("Extract cache hit (%s)", key)
+        return cached
+
+    extract_response = landingai.call("extract", lambda: client.extract(
+        schema=CLAIM_FORM_SCHEMA, markdown=markdown_content, timeout=EXTRACT_TIMEOUT_SECONDS))
+    cache.set(EXTRACT_NAMESPACE, key, extract_response.extraction)
+    return extract_response.extraction
+
+
+def insert_extraction(database: Database, extraction: dict[str, Any], matcher: Optional[MemberMatcher] = None) -> dict[str, Any]:
+    """
+    Insert an extracted claim form atomically and return the ids.
+    With a matcher, an insured or patient already on file is linked instead of inserted again.
+    """
+    if matcher is None:
+        return database.create_claim_form_extraction(extraction).data
+
+    def insert(extraction: dict[str, Any], insured_id: Optional[int], patient_id: Optional[int]) -> dict[str, Any]:
+        return database.create_claim_form_extraction(extraction, insured_id, patient_id).data
+
+    return matcher.link(extraction, insert)
+
+
+def process_segment(database: Database, cache: ContentCache, client: LandingAIADE, segment: Segment,
+                    matcher: Optional[MemberMatcher] = None) -> dict[str, Any]:
+    """ Extract and insert one form of a segmented document; failures are reported, not raised """
+    timings = {}
+    result = {"index": segment.index, "pages": segment.page_numbers}
+    markdown_content = segment.markdown
+    try:
+        with track_stage("extract", timings):
+            extraction = extract_claim_form(client, cache, markdown_content)
+        with track_stage("insert", timings):
+            ids = insert_extraction(database, extraction, matcher)
+    except Exception as e:
+        logger.error("Form %s (pages %s) failed: %s", segment.index, segment.page_numbers, str(e))
+        return {**result, "status": "failed", "error": str(e), "timings": timings}
+    return {
+        **result,
+        "status": "succeeded",
+        "extraction": extraction,
+        "extract_key": extract_key(markdown_content),
+        "ids": ids,
+        "timings": timings,
+    }
+
+
+def process_segmented_document(database: Database, cache: ContentCache, api_key: str, document: SpooledUpload,
+                               matcher: Optional[MemberMatcher] = None, pages_per_form: Optional[int] = None,
+                               concurrency: int = SEGMENT_CONCURRENCY) -> dict[str, Any]:
+    """
+    Run the ingestion pipeline for a document holding many claim forms: parse it page by page,
+    split the pages into forms (see segments.split_forms) and extract and insert the forms
+    concurrently, so the document takes about as long as its slowest form rather than all of them.
+    Raises IngestionError only when no form could be ingested.
+    """
+    timings = {}
+    client = get_client(api_key)
+
+    with track_stage("parse", timings):
+        pages = parse_pages(client, cache, document)
+    segments = split_forms(pages, pages_per_form)
+    if not segments:
+        raise IngestionError("Parser returned no pages")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(segments))), thread_name_prefix="segment") as executor:
+        forms = list(executor.map(lambda segment: process_segment(database, cache, client, segment, matcher), segments))
+    timings["forms"] = time.perf_counter() - started
+
+    failed = sum(1 for form in forms if form["status"] == "failed")
+    if failed == len(forms):
+        raise IngestionError(f"All {len(forms)} forms failed; first error: {forms[0]['error']}")
+    logger.info("Ingested %s of %s forms from %s (%s pages)", len(forms) - failed, len(forms), document.filename, len(pages))
+    return {
+        "filename": document.filename,
+        "mode": UploadMode.SEGMENTED,
+        "markdown": "\n\n".join(page.markdown for page in pages),
+        "pages": len(pages),
+        "forms": forms,
+        "succeeded": len(forms) - failed,
+        "failed": failed,
+        "timings": timings,
+    }
+
+
+def process_document(database: Database, cache: ContentCache, api_key: str, document: SpooledUpload,
+                     matcher: Optional[MemberMatcher] = None, mode: UploadMode = UploadMode.SINGLE,
+                     pages_per_form: Optional[int] = None) -> dict[str, Any]:
+    """
+    Run the full ingestion pipeline for one document.
+    This is blocking and is meant to run on a worker thread.
+    """
+    if mode == UploadMode.SEGMENTED:
+        return process_segmented_document(database, cache, api_key, document, matcher, pages_per_form)
+
+    timings = {}
+    client = get_client(api_key)
+
+    with track_stage("parse", timings):
+        markdown_content = parse_document(client, cache, document)
+
+    with track_stage("extract", timings):
+        extraction = extract_claim_form(client, cache, markdown_content)
+
+    with track_stage("insert", timings):
+        ids = insert_extraction(database, extraction, matcher)
+
+    return {
+        "filename": document.filename,
+        "markdown": markdown_content,
+        "extraction": extraction,
+        "extract_key": extract_key(markdown_content),
+        "ids": ids,
+        "timings": timings,
+    }
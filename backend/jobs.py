@@ -0,0 +1,127 @@
+""" Background job queue for long-running document processing """
+import asyncio
+import logging
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(StrEnum):
+    """ Job Status """
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """ A unit of work submitted to the job queue """
+    id: str
+    name: str
+    status: JobStatus = JobStatus.QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    func: Optional[Callable[..., Any]] = field(default=None, repr=False)
+    args: tuple = field(default=(), repr=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        """ Serialize the job for API responses """
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class QueueFullError(Exception):
+    """ Raised when the job queue cannot accept more work """
+
+
+class JobQueue:
+    """
+    Bounded queue of blocking jobs drained by a fixed pool of async workers.
+    Each job runs on a worker thread so the event loop is never blocked.
+    """
+    def __init__(self, concurrency: int = 4, max_queue_size: int = 100, max_finished_jobs: int = 1000):
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        self.max_finished_jobs = max_finished_jobs
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+
+    async def start(self):
+        """ Start the worker pool """
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info("Started job queue with %s workers (max queue size %s)", self.concurrency, self.max_queue_size)
+
+    async def stop(self):
+        """ Stop the worker pool """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def qsize(self) -> int:
+        """ Number of jobs waiting for a worker """
+        return self._queue.qsize() if self._queue else 0
+
+    def submit(self, name: str, func: Callable[..., Any], *args: Any) -> Job:
+        """ Enqueue a blocking callable; raises QueueFullError when saturated """
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started")
+        job = Job(id=uuid.uuid4().hex, name=name, func=func, args=args)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull as e:
+            raise QueueFullError("Job queue is full") from e
+        self._jobs[job.id] = job
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """ Get a job by id """
+        return self._jobs.get(job_id)
+
+    def _evict_finished(self):
+        """ Drop the oldest finished jobs once we hold more than max_finished_jobs """
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    async def _worker(self, index: int):
+        """ Run queued jobs one at a time """
+        while True:
+            job = await self._queue.get()
+            job.status = JobStatus.RUNNING
+            job.started_at = time.time()
+            try:
+                job.result = await asyncio.to_thread(job.func, *job.args)
+                job.status = JobStatus.SUCCEEDED
+            except Exception as e:
+                logger.error("Job %s (%s) failed on worker %s: %s", job.id, job.name, index, str(e))
+                logger.error(traceback.format_exc())
+                job.error = str(e)
+                job.status = JobStatus.FAILED
+            finally:
+                job.finished_at = time.time()
+                # Release the payload (file bytes) as soon as the job is done
+                job.func = None
+                job.args = ()
+                self._queue.task_done()
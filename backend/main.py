@@ -1,40 +1,108 @@
 """ Main file for the FastAPI backend """
 import os
-from io import BytesIO
 import logging
+import time
 import traceback
-from pathlib import Path
-from tempfile import NamedTemporaryFile
+import uuid
+from contextlib import asynccontextmanager
 import json
+import zipfile
 
 from typing import Optional
 
-from fastapi import FastAPI, UploadFile, HTTPException
+from fastapi import FastAPI, UploadFile, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
-from landingai_ade import LandingAIADE
-from landingai_ade.lib import pydantic_to_json_schema
-from database import (Database, InsuredInformationBase, 
-PatientInformationBase, OtherInsuranceInformationBase, AttestationBase, ClaimBase
+from sqlmodel import SQLModel
+from database import (Database, AsyncDatabase, ClaimBase, ClaimStatus, PatientInformationBase, InsuredInformationBase,
+OtherInsuranceInformationBase, AttestationBase, ContractBase, PricingRuleBase, VarianceThresholdBase
+)
+from analytics import build_analytics
+from batch import ArchiveTooLarge, expand_upload, is_archive, stream_batch
+from bulk import bulk_ingest, iter_request_records
+from export import MEDIA_TYPES, ExportFormat, iter_claim_rows, pyarrow, stream_csv, stream_ndjson, stream_parquet
+from cache import ContentCache, content_hash
+from documents import DEFAULT_TENANT, create_document_store, valid_tenant
+from ingestion import EXTRACT_NAMESPACE, UploadMode, close_clients, insert_extraction, landingai, process_document
+from jobs import JobQueue, QueueFullError
+from pricing import PricingEngine, reprice_claims
+from variance import VarianceDetector
+from matching import MemberMatcher
+from remittance import RemittanceError, check_header, ingest_remittance
+from metrics import HTTP_SECONDS, JOB_QUEUE_DEPTH, REGISTRY
+from uploads import (
+    MAX_ARCHIVE_MEMBERS, MAX_BATCH_EXPANDED_BYTES, MAX_BATCH_UPLOAD_BYTES, MAX_REMITTANCE_BYTES, MAX_UPLOAD_BYTES,
+    SpooledUpload, take_upload,
 )
 
 load_dotenv(override=True)
 
 database = Database()
+# Awaitable view of the same database for route handlers
+async_database = AsyncDatabase(database)
 
 # Configure logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-# In-memory storage for uploaded documents
-# In a production environment, you might want to use a database or session storage
-uploaded_documents = {}  # Key: session_id (or 'default'), Value: document_content
+# Processed uploads (markdown, extraction, ids) per tenant and upload id; DOCUMENT_STORE picks
+# memory (single worker), disk (workers on one host) or redis (any number of hosts)
+document_store = create_document_store()
+
+# Content-addressed store of parse/extract results so duplicate documents skip LandingAI
+content_cache = ContentCache(
+    directory=os.getenv("CONTENT_CACHE_DIR", "extracts/cache"),
+    max_bytes=int(os.getenv("CONTENT_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("CONTENT_CACHE_TTL_SECONDS", str(30 * 24 * 60 * 60))),
+)
+
+# Worker pool that runs parse -> extract -> insert off the event loop
+job_queue = JobQueue(
+    concurrency=int(os.getenv("UPLOAD_WORKERS", "4")),
+    max_queue_size=int(os.getenv("UPLOAD_QUEUE_SIZE", "100")),
+)
+JOB_QUEUE_DEPTH.set_function(job_queue.qsize)
+
+# Contract pricing rules, reloaded when they change
+pricing_engine = PricingEngine(database, reload_seconds=float(os.getenv("PRICING_RELOAD_SECONDS", "60")))
 
-app = FastAPI()
+# Links uploaded claim forms to insureds and patients already on file
+member_matcher = MemberMatcher(
+    database,
+    threshold=float(os.getenv("MATCH_THRESHOLD", "0.9")),
+    refresh_seconds=float(os.getenv("MATCH_REFRESH_SECONDS", "60")),
+)
+
+# Incremental underpayment detection; runs on a schedule when VARIANCE_INTERVAL_SECONDS > 0
+variance_detector = VarianceDetector(
+    database,
+    page_size=int(os.getenv("VARIANCE_PAGE_SIZE", "5000")),
+    interval_seconds=float(os.getenv("VARIANCE_INTERVAL_SECONDS", "0")),
+    overlap_seconds=float(os.getenv("VARIANCE_OVERLAP_SECONDS", "60")),
+)
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """ Start and stop the background workers """
+    await job_queue.start()
+    await pricing_engine.start()
+    await variance_detector.start()
+    await member_matcher.start()
+    yield
+    await member_matcher.stop()
+    await variance_detector.stop()
+    await pricing_engine.stop()
+    await job_queue.stop()
+    close_clients()
+    async_database.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,104 +112,129 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/upload")
-async def upload_file(file: UploadFile):
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """ Observe per-route request latency """
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            (request.method, route.path if route is not None else "unmatched", str(status)),
+        )
+
+# Upload routes and the largest request body each accepts; checked before the body is read
+UPLOAD_LIMITS = {
+    "/upload": MAX_UPLOAD_BYTES,
+    "/claim_upload": MAX_UPLOAD_BYTES,
+    "/remittance": MAX_REMITTANCE_BYTES,
+    "/upload/batch": MAX_BATCH_UPLOAD_BYTES,
+}
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """ Reject uploads whose Content-Length is over the limit without reading the body """
+    limit = UPLOAD_LIMITS.get(request.url.path)
+    content_length = request.headers.get("content-length")
+    if limit is not None and content_length and content_length.isdigit() and int(content_length) > limit + MULTIPART_OVERHEAD_BYTES:
+        return JSONResponse(status_code=413, content={"detail": f"Upload exceeds the {limit} byte limit"})
+    return await call_next(request)
+
+def _check_landingai():
+    """ Turn uploads away while LandingAI's circuit breaker is open instead of queuing work that will fail """
+    retry_after = landingai.breaker.retry_after()
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=503,
+            detail="Document processing is temporarily unavailable. Please retry later.",
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+
+def _tenant(x_tenant_id: Optional[str]) -> str:
+    """ Resolve the X-Tenant-ID header """
+    tenant = x_tenant_id or DEFAULT_TENANT
+    if not valid_tenant(tenant):
+        raise HTTPException(status_code=400, detail="Invalid X-Tenant-ID")
+    return tenant
+
+def _check_pages_per_form(mode: UploadMode, pages_per_form: Optional[int]):
+    if pages_per_form is not None and (mode != UploadMode.SEGMENTED or pages_per_form < 1):
+        raise HTTPException(status_code=400, detail="pages_per_form must be a positive number and requires mode=segmented")
+
+def _process_upload(api_key: str, tenant: str, upload_id: str, document: SpooledUpload,
+                    mode: UploadMode = UploadMode.SINGLE, pages_per_form: Optional[int] = None):
+    """ Job body for /upload: run the ingestion pipeline and keep the result in the document store """
+    record = {"upload_id": upload_id, "filename": document.filename, "created_at": time.time(), "mode": mode}
+    try:
+        result = process_document(database, content_cache, api_key, document, member_matcher, mode, pages_per_form)
+    except Exception as e:
+        document_store.set(tenant, upload_id, {**record, "status": "failed", "error": str(e)})
+        raise
+    finally:
+        document.close()
+    document_store.set(tenant, upload_id, {**record, "status": "succeeded", **result})
+    result.pop("markdown")
+    return {"upload_id": upload_id, **result}
+
+@app.post("/upload", status_code=202)
+async def upload_file(file: UploadFile, mode: UploadMode = UploadMode.SINGLE, pages_per_form: Optional[int] = None,
+                      x_tenant_id: Optional[str] = Header(default=None)):
     """
-    Upload and process a document file.
+    Upload a document file and queue it for processing.
     Supports PDF, DOCX, and TXT files.
+    mode=segmented treats the document as many claim forms: pages are split into forms at each
+    claim form title (or every pages_per_form pages) and every form is extracted and inserted.
+    Returns a job id and an upload id; poll GET /jobs/{job_id} on this worker, or
+    GET /documents/{upload_id} on any worker, for the result.
     """
-    temp_file_path = None
     try:
         if not file.filename:
             logger.error("No filename provided in upload request")
             raise HTTPException(status_code=400, detail="No filename provided")
        
-        # Debug: Check API key
         api_key = os.getenv("VISION_AGENT_API_KEY")
-        if api_key:
-            logger.debug("API key found: %s... length: %s", api_key[:10], (len(api_key)))
-        else:
+        if not api_key:
             logger.error("VISION_AGENT_API_KEY environment variable not set")
             raise HTTPException(
                 status_code=500,
                 detail="VISION_AGENT_API_KEY environment variable not configured"
             )
    
-        file_content = await file.read()
-        file_size = len(file_content)
+        tenant = _tenant(x_tenant_id)
+        _check_pages_per_form(mode, pages_per_form)
+        _check_landingai()
+        document = await take_upload(file)
        
-        if file_size == 0:
+        if document.size == 0:
+            document.close()
             logger.error("Uploaded file is empty")
             raise HTTPException(status_code=400, detail="Uploaded file is empty")
 
-        with NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as temp_file:
-            temp_file.write(file_content)
-            temp_file_path = temp_file.name
-
-        try:
-            client = LandingAIADE(apikey=api_key)
-        except Exception as e:
-            logger.error("Failed to initialize LandingAIADE client: %s", str(e))
-            logger.error(traceback.format_exc())
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to initialize document parser: {str(e)}"
-            ) from e
-        
+        # Record the upload before queuing it so the job's result can never be overwritten
+        upload_id = uuid.uuid4().hex
+        await run_in_threadpool(document_store.set, tenant, upload_id, {
+            "upload_id": upload_id, "filename": file.filename, "created_at": time.time(), "mode": mode, "status": "queued",
+        })
         try:
-            parse_response = client.parse(document=Path(temp_file_path))
-            
-            if not hasattr(parse_response, 'markdown'):
-                logger.error("Response object missing 'markdown' attribute. Available attributes: %s", dir(parse_response))
-                raise HTTPException(
-                    status_code=500,
-                    detail="Parser response missing expected 'markdown' attribute"
-                )
-            
-            markdown_content = parse_response.markdown
-            # Store the document content in memory for later use in chat requests
-            # Using 'default' as the key - in production, you might want to use session IDs
-            uploaded_documents['default'] = markdown_content
-
-            # Save markdown output (useful if you plan to run extract on the markdown)
-            with open("extracts/output.md", "w", encoding="utf-8") as f:
-                f.write(markdown_content)
-
-            # Build a single extraction schema that includes ALL sections we want LandingAI to extract.
-            class ClaimFormExtractionSchema(BaseModel):
-                """ Claim Form Extraction Schema """
-                insuredInformation: InsuredInformationBase = Field(..., description="The insured information.")
-                patientInformation: PatientInformationBase = Field(..., description="The patient information.")
-                otherInsuranceInformation: Optional[OtherInsuranceInformationBase] = Field(..., description="The other insurance information.")
-                attestation: AttestationBase = Field(..., description="The attestation.")
-
-            schema = pydantic_to_json_schema(ClaimFormExtractionSchema)
-            extract_response = client.extract(schema=schema, markdown=BytesIO(markdown_content.encode('utf-8')))
-
-            with open("extracts/extract_response.json", "w", encoding="utf-8") as f:
-                json.dump(extract_response.extraction, f, indent=4)
-            
-            # Add extract response to the database
-            response_other = None
-            other_insurance_id = None
-            if "otherInsuranceInformation" in extract_response.extraction:
-                response_other = database.create_other_insurance_information(extract_response.extraction["otherInsuranceInformation"])
-                other_insurance_id = response_other.data[0]["id"]
-            response_insured = database.create_insured_information(extract_response.extraction["insuredInformation"], other_insurance_id)
-            response_att = database.create_attestation(extract_response.extraction["attestation"])
-
-            database.create_patient_information(extract_response.extraction["patientInformation"], response_insured.data[0]["id"], response_att.data[0]["id"])
-
-            
-        except Exception as e:
-            logger.error("Failed to parse document: %s", str(e))
-            logger.error(traceback.format_exc())
+            job = job_queue.submit(file.filename, _process_upload, api_key, tenant, upload_id, document, mode, pages_per_form)
+        except QueueFullError as e:
+            document.close()
+            await run_in_threadpool(document_store.delete, tenant, upload_id)
+            logger.warning("Upload queue is full, rejecting %s", file.filename)
             raise HTTPException(
-                status_code=500,
-                detail=f"Failed to parse document: {str(e)}"
+                status_code=429,
+                detail="Too many documents are being processed. Please retry later.",
+                headers={"Retry-After": "5"},
             ) from e
 
-        return {"message": "Document uploaded successfully"}
+        return {"message": "Document queued for processing", "job_id": job.id, "upload_id": upload_id, "status": job.status}
 
     except HTTPException:
         # Re-raise HTTP exceptions as-is
@@ -154,44 +247,149 @@ async def upload_file(file: UploadFile):
             status_code=500,
             detail=f"Unexpected error: {str(e)}. Check server logs for details."
         ) from e
-    finally:
-        # Clean up temporary file
-        if temp_file_path and os.path.exists(temp_file_path):
+
+def _process_batch_document(api_key: str, document: SpooledUpload, mode: UploadMode, pages_per_form: Optional[int]):
+    """ Batch body: run the ingestion pipeline without keeping the markdown around """
+    result = process_document(database, content_cache, api_key, document, member_matcher, mode, pages_per_form)
+    result.pop("markdown")
+    return result
+
+@app.post("/upload/batch")
+async def upload_batch(files: list[UploadFile], concurrency: Optional[int] = None, mode: UploadMode = UploadMode.SINGLE,
+                       pages_per_form: Optional[int] = None):
+    """
+    Upload many documents (or zip archives of documents) and process them in parallel.
+    Streams one NDJSON line per document as it completes, followed by a summary line.
+    mode and pages_per_form apply to every document, as for /upload.
+    """
+    api_key = os.getenv("VISION_AGENT_API_KEY")
+    if not api_key:
+        logger.error("VISION_AGENT_API_KEY environment variable not set")
+        raise HTTPException(
+            status_code=500,
+            detail="VISION_AGENT_API_KEY environment variable not configured"
+        )
+    _check_pages_per_form(mode, pages_per_form)
+    _check_landingai()
+
+    documents = []
+    expanded = 0
+    try:
+        for file in files:
+            if not file.filename:
+                raise HTTPException(status_code=400, detail="No filename provided")
+            # Only archives get the batch limit; a document on its own is held to the /upload limit
+            document = await take_upload(file, MAX_BATCH_UPLOAD_BYTES if is_archive(file.filename) else MAX_UPLOAD_BYTES)
+            if document.size == 0:
+                document.close()
+                raise HTTPException(status_code=400, detail=f"Uploaded file {file.filename} is empty")
             try:
-                os.unlink(temp_file_path)
-            except OSError as e:
-                logger.warning("Failed to delete temporary file %s: %s", temp_file_path, str(e))
+                expanded_documents = await run_in_threadpool(
+                    expand_upload, document, MAX_UPLOAD_BYTES, MAX_ARCHIVE_MEMBERS, MAX_BATCH_EXPANDED_BYTES - expanded)
+            except zipfile.BadZipFile as e:
+                raise HTTPException(status_code=400, detail=f"Invalid zip archive: {file.filename}") from e
+            except ArchiveTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e)) from e
+            documents.extend(expanded_documents)
+            expanded += sum(expanded_document.size for expanded_document in expanded_documents)
+            if expanded > MAX_BATCH_EXPANDED_BYTES:
+                raise HTTPException(status_code=413, detail=f"Batch expands past the {MAX_BATCH_EXPANDED_BYTES} byte limit")
+    except BaseException:
+        for document in documents:
+            document.close()
+        raise
+    if not documents:
+        raise HTTPException(status_code=400, detail="No documents found in upload")
+
+    max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+    concurrency = min(concurrency or max_concurrency, max_concurrency)
+    logger.info("Processing batch of %s documents with concurrency %s", len(documents), concurrency)
+    return StreamingResponse(
+        stream_batch(documents, lambda document: _process_batch_document(api_key, document, mode, pages_per_form), concurrency),
+        media_type="application/x-ndjson",
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """ Get the status and result of a queued job """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/documents/stats")
+async def get_document_store_stats():
+    """ Size of the document store """
+    return await run_in_threadpool(document_store.stats)
+
+@app.get("/documents/{upload_id}")
+async def get_document(upload_id: str, include_markdown: bool = False, x_tenant_id: Optional[str] = Header(default=None)):
+    """ Get an upload's status, extraction and inserted ids """
+    record = await run_in_threadpool(document_store.get, _tenant(x_tenant_id), upload_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not include_markdown:
+        record = {key: value for key, value in record.items() if key != "markdown"}
+    return record
+
+@app.delete("/documents/{upload_id}")
+async def delete_document(upload_id: str, x_tenant_id: Optional[str] = Header(default=None)):
+    """ Forget an upload """
+    if not await run_in_threadpool(document_store.delete, _tenant(x_tenant_id), upload_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"message": "Document deleted"}
 
 @app.post("/insert_extract")
-async def insert_extract():
-    """ Insert extract """
-    with open("extracts/extract_response.json", "r", encoding="utf-8") as f:
-        extract_response = json.load(f)
-    response_other = None
-    other_insurance_id = None
-    if "otherInsuranceInformation" in extract_response.extraction:      
-        response_other = database.create_other_insurance_information(extract_response.extraction["otherInsuranceInformation"])
-        other_insurance_id = response_other.data[0]["id"]
-    response_insured = database.create_insured_information(extract_response.extraction["insuredInformation"], other_insurance_id)
-    response_att = database.create_attestation(extract_response.extraction["attestation"])
-    database.create_patient_information(extract_response.extraction["patientInformation"], response_insured.data[0]["id"], response_att.data[0]["id"])
-    return {"message": "Extract inserted successfully"}
+async def insert_extract(upload_id: Optional[str] = None, extract_key: Optional[str] = None,
+                         x_tenant_id: Optional[str] = Header(default=None)):
+    """
+    Insert an upload's extraction (upload_id), or a cached extract (extract_key), from the upload job result.
+    For a segmented upload every successfully extracted form is inserted.
+    """
+    extractions = []
+    if upload_id is not None:
+        record = await run_in_threadpool(document_store.get, _tenant(x_tenant_id), upload_id)
+        if record is not None and record.get("extraction") is not None:
+            extractions = [record["extraction"]]
+        elif record is not None:
+            extractions = [form["extraction"] for form in record.get("forms", []) if form.get("extraction") is not None]
+    elif extract_key is not None:
+        extraction = content_cache.get(EXTRACT_NAMESPACE, extract_key)
+        extractions = [extraction] if extraction is not None else []
+    else:
+        raise HTTPException(status_code=400, detail="Pass upload_id or extract_key")
+    if not extractions:
+        raise HTTPException(status_code=404, detail="Extract not found")
+    for extraction in extractions:
+        await run_in_threadpool(insert_extraction, database, extraction, member_matcher)
+    return {"message": "Extract inserted successfully", "inserted": len(extractions)}
+
+@app.get("/landingai/stats")
+async def get_landingai_stats():
+    """ LandingAI circuit breaker state and rate limiter tokens """
+    return landingai.stats()
+
+@app.get("/matching/stats")
+async def get_matching_stats():
+    """ Sizes of the member matching indexes """
+    return member_matcher.stats()
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """ Get cache hit/miss counters """
+    return {"content": content_cache.stats(), "entities": database.cache.stats()}
 
 @app.post("/claim_upload")
 async def claim_upload(file: UploadFile):
     """ Upload a claim """
-    temp_file_path = None
+    document = None
     try:
        if not file.filename:
           logger.error("No filename provided in upload request")
           raise HTTPException(status_code=400, detail="No filename provided")
-       file_content = await file.read()
-       file_size = len(file_content)
-       if file_size == 0:
+       document = await take_upload(file)
+       if document.size == 0:
           raise HTTPException(status_code=400, detail="Uploaded file is empty")
-       with NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as temp_file:
-         temp_file.write(file_content)
-         temp_file_path = temp_file.name
     
     except HTTPException:
         # Re-raise HTTP exceptions as-is
@@ -205,77 +403,368 @@ async def claim_upload(file: UploadFile):
             detail=f"Unexpected error: {str(e)}. Check server logs for details."
         ) from e
     finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-            except OSError as e:
-                logger.warning("Failed to delete temporary file %s: %s", temp_file_path, str(e))
+        if document is not None:
+            document.close()
     return {"message": "Claim uploaded successfully"}
 
+def _process_remittance(document: SpooledUpload, batch_size: int):
+    """ Job body for /remittance: post every claim payment in the file """
+    try:
+        return ingest_remittance(database, document, document.filename, batch_size)
+    finally:
+        document.close()
+
+@app.post("/remittance", status_code=202)
+async def upload_remittance(file: UploadFile, batch_size: Optional[int] = None):
+    """
+    Upload an 835 (ERA) remittance file and post its payments to the matching claims.
+    Returns a job id; poll GET /jobs/{job_id} for the throughput and unmatched remits.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No filename provided")
+    document = await take_upload(file, MAX_REMITTANCE_BYTES)
+    if document.size == 0:
+        document.close()
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    try:
+        await run_in_threadpool(check_header, document)
+    except RemittanceError as e:
+        document.close()
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    try:
+        job = job_queue.submit(file.filename, _process_remittance, document,
+                               batch_size or int(os.getenv("REMITTANCE_BATCH_SIZE", "1000")))
+    except QueueFullError as e:
+        document.close()
+        raise HTTPException(status_code=429, detail="Too many jobs in progress", headers={"Retry-After": "5"}) from e
+    return {"message": "Remittance queued for processing", "job_id": job.id, "status": job.status}
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+def _page_limit(limit: Optional[int]) -> int:
+    """ Resolve the requested page size against the configured default and maximum """
+    limit = limit or DEFAULT_PAGE_SIZE
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+def _page_columns(fields: Optional[str], model: type[SQLModel]) -> Optional[list[str]]:
+    """ Parse a comma-separated fields= projection; id is always included for the cursor """
+    if not fields:
+        return None
+    columns = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [column for column in columns if column != "id" and column not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [column for column in columns if column != "id"]
+
+def _page(response, limit: int):
+    """ Build a page from a query that fetched limit + 1 rows """
+    rows = response.data
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    return {"data": rows[:limit], "next_cursor": next_cursor}
+
+def _etag_response(request: Request, response):
+    """ Serialize a lookup with an ETag, answering 304 when If-None-Match matches """
+    body = jsonable_encoder(response)
+    etag = f'"{content_hash(json.dumps(body, sort_keys=True, default=str))[:32]}"'
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(body, headers={"ETag": etag})
+
+def _bulk_chunk_size(chunk_size: Optional[int]) -> int:
+    """ Resolve the requested bulk chunk size against the configured default and maximum """
+    max_chunk_size = int(os.getenv("BULK_MAX_CHUNK_SIZE", "5000"))
+    chunk_size = chunk_size or int(os.getenv("BULK_CHUNK_SIZE", "500"))
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    return min(chunk_size, max_chunk_size)
+
+@app.post("/patient_information/bulk")
+async def bulk_create_patient_information(request: Request, chunk_size: Optional[int] = None):
+    """ Create many patient information rows from a JSON array or NDJSON stream """
+    return await bulk_ingest(
+        iter_request_records(request), PatientInformationBase,
+        async_database.bulk_create_patient_information, _bulk_chunk_size(chunk_size)
+    )
+
+@app.post("/insured_information/bulk")
+async def bulk_create_insured_information(request: Request, chunk_size: Optional[int] = None):
+    """ Create many insured information rows from a JSON array or NDJSON stream """
+    return await bulk_ingest(
+        iter_request_records(request), InsuredInformationBase,
+        async_database.bulk_create_insured_information, _bulk_chunk_size(chunk_size)
+    )
+
+@app.post("/attestation/bulk")
+async def bulk_create_attestation(request: Request, chunk_size: Optional[int] = None):
+    """ Create many attestations from a JSON array or NDJSON stream """
+    return await bulk_ingest(
+        iter_request_records(request), AttestationBase,
+        async_database.bulk_create_attestation, _bulk_chunk_size(chunk_size)
+    )
+
+@app.post("/claims/bulk")
+async def bulk_create_claims(request: Request, chunk_size: Optional[int] = None):
+    """
+    Create many claims from a JSON array or NDJSON stream.
+    Rows without expected that no pricing rule covers are reported as errors.
+    """
+    async def insert_chunk(rows: list[tuple[int, ClaimBase]], chunk_size: int):
+        priced, errors = [], []
+        for index, claim in rows:
+            claim_errors = _fill_expected(claim)
+            if claim_errors:
+                errors.append({"index": index, "error": claim_errors})
+            else:
+                priced.append((index, claim))
+        result = await async_database.bulk_create_claims(priced, chunk_size)
+        return {"inserted": result["inserted"], "errors": result["errors"] + errors}
+
+    return await bulk_ingest(iter_request_records(request), ClaimBase, insert_chunk, _bulk_chunk_size(chunk_size))
+
 @app.get("/patient_information")
-async def get_all_patient_information():
-    """ Get all patient information """
-    return database.get_all_patient_information()
+async def get_all_patient_information(after: Optional[int] = None, limit: Optional[int] = None, fields: Optional[str] = None,
+                                      insured_id: Optional[int] = None, patient_last_name: Optional[str] = None):
+    """ Get a page of patient information (pass next_cursor back as after= for the next page) """
+    limit = _page_limit(limit)
+    columns = _page_columns(fields, PatientInformationBase)
+    return _page(await async_database.get_patient_information_page(after, limit + 1, columns, insured_id, patient_last_name), limit)
 
 @app.get("/patient_information/{patient_id}")
-async def get_patient_information(patient_id: int):
+async def get_patient_information(patient_id: int, request: Request):
     """ Get patient information by id """
-    return database.get_patient_information(patient_id)
+    return _etag_response(request, await async_database.get_patient_information(patient_id))
 
 @app.get("/patient_information/insured_id/{insured_id}")
 async def get_all_patient_information_by_insured_id(insured_id: int):
     """ Get all patient information by insured id """
-    return database.get_all_patient_information_by_insured_id(insured_id)
+    return await async_database.get_all_patient_information_by_insured_id(insured_id)
 
 @app.get("/insured_information")
-async def get_all_insured_information():
-    """ Get all insured information """
-    return database.get_all_insured_information()
+async def get_all_insured_information(after: Optional[int] = None, limit: Optional[int] = None, fields: Optional[str] = None,
+                                      last_name: Optional[str] = None, identification_number: Optional[int] = None):
+    """ Get a page of insured information (pass next_cursor back as after= for the next page) """
+    limit = _page_limit(limit)
+    columns = _page_columns(fields, InsuredInformationBase)
+    return _page(await async_database.get_insured_information_page(after, limit + 1, columns, last_name, identification_number), limit)
 
 @app.get("/insured_information/{insured_id}")
-async def get_insured_information(insured_id: int):
+async def get_insured_information(insured_id: int, request: Request):
     """ Get insured information by id """
-    return database.get_insured_information(insured_id)
+    return _etag_response(request, await async_database.get_insured_information(insured_id))
 
 @app.get("/insured_information/other_insurance/{other_insurance_id}")
 async def get_all_insured_information_by_other_insurance_id(other_insurance_id: int):
     """ Get all insured information by other insurance id """
-    return database.get_all_insured_information_by_other_insurance_id(other_insurance_id)
+    return await async_database.get_all_insured_information_by_other_insurance_id(other_insurance_id)
 
 @app.get("/other_insurance_information")
-async def get_all_other_insurance_information():
-    """ Get all other insurance information """
-    return database.get_all_other_insurance_information()
+async def get_all_other_insurance_information(after: Optional[int] = None, limit: Optional[int] = None, fields: Optional[str] = None):
+    """ Get a page of other insurance information (pass next_cursor back as after= for the next page) """
+    limit = _page_limit(limit)
+    columns = _page_columns(fields, OtherInsuranceInformationBase)
+    return _page(await async_database.get_other_insurance_information_page(after, limit + 1, columns), limit)
 
 @app.get("/other_insurance_information/{other_insurance_id}")
-async def get_other_insurance_information(other_insurance_id: int):
+async def get_other_insurance_information(other_insurance_id: int, request: Request):
     """ Get other insurance information by id """
-    return database.get_other_insurance_information(other_insurance_id)
+    return _etag_response(request, await async_database.get_other_insurance_information(other_insurance_id))
 
 @app.get("/attestation")
-async def get_all_attestation():
-    """ Get all attestation """
-    return database.get_all_attestation()
+async def get_all_attestation(after: Optional[int] = None, limit: Optional[int] = None, fields: Optional[str] = None):
+    """ Get a page of attestations (pass next_cursor back as after= for the next page) """
+    limit = _page_limit(limit)
+    columns = _page_columns(fields, AttestationBase)
+    return _page(await async_database.get_attestation_page(after, limit + 1, columns), limit)
 
 @app.get("/attestation/{attestation_id}")
-async def get_attestation(attestation_id: int):
+async def get_attestation(attestation_id: int, request: Request):
     """ Get attestation by id """
-    return database.get_attestation(attestation_id)
+    return _etag_response(request, await async_database.get_attestation(attestation_id))
 
 @app.get("/claims")
-async def get_all_claims():
-    """ Get all claims """
-    return database.get_all_claims()
+async def get_all_claims(after: Optional[int] = None, limit: Optional[int] = None, fields: Optional[str] = None,
+                         status: Optional[ClaimStatus] = None, payer: Optional[str] = None, patient_id: Optional[int] = None,
+                         date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """
+    Get a page of claims (pass next_cursor back as after= for the next page).
+    date_from/date_to filter date_of_service inclusively.
+    """
+    limit = _page_limit(limit)
+    columns = _page_columns(fields, ClaimBase)
+    return _page(await async_database.get_claims_page(after, limit + 1, columns, status, payer, patient_id, date_from, date_to), limit)
+
+@app.get("/claims/export")
+async def export_claims(format: ExportFormat = ExportFormat.NDJSON, include_patient: bool = False,
+                        status: Optional[ClaimStatus] = None, payer: Optional[str] = None,
+                        date_from: Optional[str] = None, date_to: Optional[str] = None,
+                        after: Optional[int] = None, page_size: Optional[int] = None):
+    """
+    Stream every matching claim as NDJSON, CSV or Parquet with constant memory.
+    Rows come out in id order; to resume an interrupted export pass the last id received as after=.
+    """
+    if format == ExportFormat.PARQUET and pyarrow is None:
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow to be installed")
+    pages = iter_claim_rows(database, _page_limit(page_size), after, include_patient, status, payer, date_from, date_to)
+    streams = {ExportFormat.NDJSON: stream_ndjson, ExportFormat.CSV: stream_csv, ExportFormat.PARQUET: stream_parquet}
+    return StreamingResponse(
+        streams[format](pages),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="claims.{format}"'},
+    )
 
 @app.get("/claims/{claim_id}")
-async def get_claim(claim_id: int):
+async def get_claim(claim_id: int, request: Request):
     """ Get claim by id """
-    return database.get_claim(claim_id)
+    return _etag_response(request, await async_database.get_claim(claim_id))
+
+def _fill_expected(claim: ClaimBase) -> Optional[list[dict]]:
+    """
+    Compute a claim's expected reimbursement from the pricing rules when the caller left it out.
+    Returns validation errors (in FastAPI's 422 shape) when it is missing and no rule prices the claim.
+    """
+    if claim.expected is None:
+        claim.expected = pricing_engine.index.expected(claim.payer, claim.procedure_code, claim.date_of_service, claim.billed_amount)
+    if claim.expected is None:
+        return [{
+            "type": "missing",
+            "loc": ["expected"],
+            "msg": f"expected is required: no pricing rule for payer {claim.payer!r}, procedure {claim.procedure_code} "
+                   f"on {claim.date_of_service}",
+        }]
+    return None
 
 @app.post("/claims")
 async def create_claim(claim: ClaimBase):
-    """ Create a new claim """
-    return database.create_claim(claim)
+    """ Create a new claim; expected may be left out when a pricing rule covers the claim """
+    errors = _fill_expected(claim)
+    if errors:
+        raise HTTPException(status_code=422, detail=[{**error, "loc": ["body", *error["loc"]]} for error in errors])
+    return await async_database.create_claim(claim)
+
+@app.get("/contracts")
+async def get_all_contracts():
+    """ Get all contracts """
+    return await async_database.get_all_contracts()
+
+@app.post("/contracts")
+async def create_contract(contract: ContractBase):
+    """ Create a new contract """
+    return await async_database.create_contract(contract)
+
+@app.get("/pricing_rules")
+async def get_all_pricing_rules(contract_id: Optional[int] = None):
+    """ Get all pricing rules, optionally for one contract """
+    return await async_database.get_all_pricing_rules(contract_id)
+
+@app.post("/pricing_rules")
+async def create_pricing_rule(pricing_rule: PricingRuleBase):
+    """ Create a new pricing rule """
+    return await async_database.create_pricing_rule(pricing_rule)
+
+@app.get("/pricing/calculate")
+async def calculate_expected(payer: str, procedure_code: int, date_of_service: Optional[str] = None,
+                             billed_amount: Optional[float] = None):
+    """ Expected reimbursement for a procedure under the payer's contract in force on date_of_service """
+    rate = pricing_engine.index.lookup(payer, procedure_code, date_of_service)
+    if rate is None:
+        raise HTTPException(status_code=404, detail=f"No pricing rule for procedure {procedure_code} with {payer}")
+    return {
+        "procedureCode": str(procedure_code),
+        "procedureName": rate.procedure_name,
+        "expectedReimbursement": rate.expected(billed_amount),
+        "reimbursementRate": rate.reimbursement_rate,
+        "unit": rate.unit,
+        "contractReference": rate.contract_number,
+        "contractId": rate.contract_id,
+        "ruleId": rate.rule_id,
+    }
+
+@app.get("/pricing/stats")
+async def get_pricing_stats():
+    """ Size and version of the loaded pricing index """
+    return pricing_engine.stats()
+
+@app.post("/pricing/reload")
+async def reload_pricing():
+    """ Rebuild the pricing index now """
+    await run_in_threadpool(pricing_engine.reload)
+    return pricing_engine.stats()
+
+@app.post("/pricing/reprice", status_code=202)
+async def reprice(payer: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                  page_size: Optional[int] = None):
+    """ Recompute expected reimbursement for existing claims in the background; poll /jobs/{job_id} """
+    try:
+        job = job_queue.submit("reprice", reprice_claims, database, pricing_engine.index, payer,
+                               page_size or int(os.getenv("REPRICE_PAGE_SIZE", "5000")), date_from, date_to)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail="Too many jobs in progress", headers={"Retry-After": "5"}) from e
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/variance/run", status_code=202)
+async def run_variance_detection(full: bool = False):
+    """
+    Flag underpaid claims changed since the last run in the background; poll /jobs/{job_id}.
+    Pass full=true to re-evaluate every claim, e.g. after changing thresholds.
+    """
+    try:
+        job = job_queue.submit("variance", variance_detector.run, full)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail="Too many jobs in progress", headers={"Retry-After": "5"}) from e
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/variance")
+async def get_claim_variances(after: Optional[int] = None, limit: Optional[int] = None, payer: Optional[str] = None,
+                              min_variance: Optional[float] = None, date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """ Get a page of underpaid claims (pass next_cursor back as after= for the next page) """
+    limit = _page_limit(limit)
+    return _page(await async_database.get_claim_variances_page(after, limit + 1, None, payer, min_variance, date_from, date_to), limit)
+
+@app.get("/variance/summary")
+async def get_variance_summary(payer: Optional[str] = None):
+    """ Get underpayment totals per payer """
+    return await async_database.get_variance_summary(payer)
+
+@app.get("/variance/runs/latest")
+async def get_last_variance_run():
+    """ Get the most recent variance run """
+    runs = (await async_database.get_last_variance_run()).data
+    if not runs:
+        raise HTTPException(status_code=404, detail="No variance run yet")
+    return runs[0]
+
+@app.get("/variance/thresholds")
+async def get_variance_thresholds():
+    """ Get the per payer variance thresholds """
+    return await async_database.get_variance_thresholds()
+
+@app.put("/variance/thresholds")
+async def upsert_variance_threshold(threshold: VarianceThresholdBase):
+    """ Create or replace a payer's variance threshold (payer '*' sets the default) """
+    return await async_database.upsert_variance_threshold(threshold)
+
+@app.delete("/variance/thresholds/{payer}")
+async def delete_variance_threshold(payer: str):
+    """ Delete a payer's variance threshold """
+    return await async_database.delete_variance_threshold(payer)
+
+@app.get("/analytics")
+async def get_analytics(payer: Optional[str] = None, month_from: Optional[str] = None, month_to: Optional[str] = None,
+                        months: int = 6):
+    """
+    Get reimbursement analytics (revenue, variance, denial rate, revenue by payer, monthly trend).
+    month_from/month_to are YYYY-MM; months limits the length of the monthly trend.
+    """
+    rollups = await async_database.get_claim_rollups(payer, month_from, month_to)
+    return build_analytics(rollups, months)
+
+@app.get("/metrics")
+async def get_metrics():
+    """ Prometheus metrics """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def read_root():
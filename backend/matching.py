@@ -0,0 +1,317 @@
+""" Ingestion-time matching of extracted insureds and patients against existing records """
+import asyncio
+import logging
+import re
+import threading
+from dataclasses import asdict, dataclass
+from difflib import SequenceMatcher
+from typing import Any, Callable, Iterable, Optional
+
+from pricing import parse_date
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "drive": "dr", "boulevard": "blvd", "lane": "ln",
+    "court": "ct", "place": "pl", "suite": "ste", "apartment": "apt", "north": "n", "south": "s",
+    "east": "e", "west": "w",
+}
+LOCK_STRIPES = 64
+# Below this first-name similarity two people are different (twins, spouses, siblings) no matter how
+# much else agrees; JOHN/JON passes, JOHN/JOAN and JOHN/JANE do not
+MIN_FIRST_NAME_SIMILARITY = 0.8
+
+
+def normalize_name(value: Optional[str]) -> str:
+    """ Upper-case letters only, so "O'Neil ", "ONEIL" and "o neil" compare equal """
+    return re.sub(r"[^A-Z]", "", str(value or "").upper())
+
+
+def normalize_dob(value: Any) -> str:
+    """ ISO date for any format parse_date understands, else the stripped input """
+    parsed = parse_date(value)
+    return parsed.isoformat() if parsed is not None else str(value or "").strip()
+
+
+def normalize_address(value: Optional[str]) -> str:
+    """ Lower-case words with punctuation dropped and common street words abbreviated """
+    words = re.sub(r"[^a-z0-9 ]", " ", str(value or "").lower()).split()
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def normalize_zip(value: Any) -> str:
+    return re.sub(r"[^0-9]", "", str(value or ""))[:5]
+
+
+def _similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+@dataclass(frozen=True)
+class Member:
+    """ The normalized identity fields of an insured or patient """
+    last_name: str
+    first_name: str
+    date_of_birth: str
+    address: str
+    zip: str
+    identification_number: Optional[int] = None
+
+    @property
+    def name_key(self) -> tuple[str, str, str]:
+        return (self.last_name, self.first_name, self.date_of_birth)
+
+    @property
+    def blocks(self) -> list[tuple[str, ...]]:
+        """ Candidate blocks for fuzzy matching: same DOB, or same zip and last-name prefix (catches DOB typos) """
+        blocks = []
+        if self.date_of_birth:
+            blocks.append(("dob", self.date_of_birth))
+        if self.zip and self.last_name:
+            blocks.append(("zip", self.zip, self.last_name[:3]))
+        return blocks
+
+
+def insured_member(row: dict[str, Any]) -> Member:
+    """ Member for an Insured_Information row or extracted insuredInformation section """
+    identification_number = row.get("identification_number")
+    return Member(
+        last_name=normalize_name(row.get("last_name")),
+        first_name=normalize_name(row.get("first_name")),
+        date_of_birth=normalize_dob(row.get("date_of_birth")),
+        address=normalize_address(row.get("address")),
+        zip=normalize_zip(row.get("zip")),
+        identification_number=int(identification_number) if identification_number not in (None, "") else None,
+    )
+
+
+def patient_member(row: dict[str, Any]) -> Member:
+    """ Member for a Patient_Information row or extracted patientInformation section """
+    return Member(
+        last_name=normalize_name(row.get("patient_last_name")),
+        first_name=normalize_name(row.get("patient_first_name")),
+        date_of_birth=normalize_dob(row.get("patient_date_of_birth")),
+        address=normalize_address(row.get("patient_address")),
+        zip=normalize_zip(row.get("patient_zip")),
+    )
+
+
+@dataclass(frozen=True)
+class Match:
+    """ An existing record a new one was linked to """
+    id: int
+    method: str  # identification_number | name_dob | fuzzy
+    score: float
+
+
+class MemberIndex:
+    """
+    In-memory index of members with exact lookups by identification number and by
+    (last name, first name, DOB), and fuzzy matching restricted to small candidate blocks,
+    so a lookup never scans the whole population.
+    """
+    def __init__(self, threshold: float = 0.9):
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._members: dict[int, Member] = {}
+        self._by_identifier: dict[int, int] = {}
+        self._by_name_key: dict[tuple[str, str, str], int] = {}
+        self._blocks: dict[tuple[str, ...], list[int]] = {}
+        # Highest id loaded from the database; records added after our own inserts don't move it
+        self.cursor = 0
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def add(self, member_id: int, member: Member):
+        """ Index a record; the lowest id wins when several share a key """
+        with self._lock:
+            if member_id in self._members:
+                return
+            self._members[member_id] = member
+            if member.identification_number is not None:
+                self._by_identifier.setdefault(member.identification_number, member_id)
+            if member.last_name and member.date_of_birth:
+                self._by_name_key.setdefault(member.name_key, member_id)
+            for block in member.blocks:
+                self._blocks.setdefault(block, []).append(member_id)
+
+    @staticmethod
+    def _compatible(member: Member, candidate: Member) -> bool:
+        """ Different identification numbers are different people, however similar the names """
+        return (member.identification_number is None or candidate.identification_number is None
+                or member.identification_number == candidate.identification_number)
+
+    @staticmethod
+    def _first_name_similarity(member: Member, candidate: Member) -> float:
+        """
+        First-name similarity if it is high enough to be the same person, else 0.0.
+        A bare initial agrees with any name starting with it.
+        """
+        first, other = member.first_name, candidate.first_name
+        if not first or not other:
+            return 0.0
+        if (len(first) == 1 or len(other) == 1) and first[0] == other[0]:
+            return 1.0
+        similarity = _similarity(first, other)
+        return similarity if similarity >= MIN_FIRST_NAME_SIMILARITY else 0.0
+
+    def _score(self, member: Member, candidate: Member) -> float:
+        """
+        Weighted similarity of names, DOB and address.
+        A different first name rules a candidate out, since DOB, last name and address are
+        shared within a household. Cheap exact comparisons go first and the score is abandoned
+        (0.0) as soon as even perfect name and address similarity could not reach the threshold.
+        """
+        first_name = self._first_name_similarity(member, candidate)
+        if not first_name:
+            return 0.0
+        dob = 0.3 if member.date_of_birth and member.date_of_birth == candidate.date_of_birth else 0.0
+        zip_code = 0.05 if member.zip and member.zip == candidate.zip else 0.0
+        if dob + zip_code + 0.5 + 0.15 < self.threshold:
+            return 0.0
+        last_name = 0.3 * _similarity(member.last_name, candidate.last_name)
+        if dob + zip_code + last_name + 0.2 + 0.15 < self.threshold:
+            return 0.0
+        name = last_name + 0.2 * first_name
+        if dob + zip_code + name + 0.15 < self.threshold:
+            return 0.0
+        address = 0.15 * (_similarity(member.address, candidate.address) if member.address and candidate.address else 0.5)
+        return dob + zip_code + name + address
+
+    def match(self, member: Member) -> Optional[Match]:
+        """ The existing record this member refers to, if any """
+        with self._lock:
+            if member.identification_number is not None:
+                member_id = self._by_identifier.get(member.identification_number)
+                if member_id is not None:
+                    return Match(member_id, "identification_number", 1.0)
+            member_id = self._by_name_key.get(member.name_key)
+            if (member_id is not None and member.last_name and member.date_of_birth
+                    and self._compatible(member, self._members[member_id])):
+                return Match(member_id, "name_dob", 1.0)
+
+            best = None
+            seen = set()
+            for block in member.blocks:
+                for candidate_id in self._blocks.get(block, ()):
+                    if candidate_id in seen:
+                        continue
+                    seen.add(candidate_id)
+                    candidate = self._members[candidate_id]
+                    if not self._compatible(member, candidate):
+                        continue
+                    score = self._score(member, candidate)
+                    if score >= self.threshold and (best is None or score > best.score):
+                        best = Match(candidate_id, "fuzzy", round(score, 4))
+            return best
+
+
+class MemberMatcher:
+    """
+    Links extracted claim forms to existing Insured_Information and Patient_Information rows.
+    The indexes are warmed from the database at startup and then refreshed incrementally
+    (rows with an id above the highest one seen) to pick up records written elsewhere.
+    """
+    def __init__(self, database, threshold: float = 0.9, page_size: int = 5000, refresh_seconds: float = 60.0):
+        self.database = database
+        self.page_size = page_size
+        self.refresh_seconds = refresh_seconds
+        self.insured = MemberIndex(threshold)
+        self.patients = MemberIndex(threshold)
+        self.warm = False
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._task: Optional[asyncio.Task] = None
+
+    def _load(self, index: MemberIndex, fetch_page: Callable, columns: list[str], to_member: Callable[[dict[str, Any]], Member]) -> int:
+        loaded = 0
+        while True:
+            # Only an empty page ends the load: PostgREST caps responses at max-rows, below page_size
+            page = fetch_page(index.cursor or None, self.page_size, columns).data
+            if not page:
+                return loaded
+            for row in page:
+                index.add(row["id"], to_member(row))
+            loaded += len(page)
+            index.cursor = page[-1]["id"]
+
+    def refresh(self) -> dict[str, int]:
+        """ Load every record not yet indexed """
+        insured = self._load(self.insured, self.database.get_insured_information_page,
+                             ["id", "last_name", "first_name", "date_of_birth", "address", "zip", "identification_number"],
+                             insured_member)
+        patients = self._load(self.patients, self.database.get_patient_information_page,
+                              ["id", "patient_last_name", "patient_first_name", "patient_date_of_birth", "patient_address", "patient_zip"],
+                              patient_member)
+        self.warm = True
+        return {"insured": insured, "patients": patients}
+
+    async def start(self):
+        """ Warm the indexes and keep refreshing them """
+        try:
+            loaded = await asyncio.to_thread(self.refresh)
+            logger.info("Warmed member indexes with %s insured and %s patients", loaded["insured"], loaded["patients"])
+        except Exception as e:
+            logger.error("Failed to warm member indexes: %s", str(e))
+        if self.refresh_seconds > 0:
+            self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        """ Stop refreshing """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error("Failed to refresh member indexes: %s", str(e))
+
+    def _stripe_locks(self, members: Iterable[Member]) -> list[threading.Lock]:
+        """ Locks serializing concurrent forms for the same people, always taken in the same order """
+        stripes = {hash((member.last_name, member.date_of_birth)) % LOCK_STRIPES for member in members}
+        return [self._locks[stripe] for stripe in sorted(stripes)]
+
+    def link(self, extraction: dict[str, Any], insert: Callable[[dict[str, Any], Optional[int], Optional[int]], dict[str, Any]]) -> dict[str, Any]:
+        """
+        Match the form's insured and patient, then call insert(extraction, insured_id, patient_id)
+        with the ids of any existing records so only new people are inserted.
+        Returns insert's ids plus how each person was matched.
+        """
+        insured = insured_member(extraction.get("insuredInformation") or {})
+        patient = patient_member(extraction.get("patientInformation") or {})
+        locks = self._stripe_locks([insured, patient])
+        for lock in locks:
+            lock.acquire()
+        try:
+            insured_match = self.insured.match(insured)
+            patient_match = self.patients.match(patient)
+            ids = insert(extraction,
+                         insured_match.id if insured_match else None,
+                         patient_match.id if patient_match else None)
+            if insured_match is None and ids.get("insured_id") is not None:
+                self.insured.add(ids["insured_id"], insured)
+            if patient_match is None and ids.get("patient_id") is not None:
+                self.patients.add(ids["patient_id"], patient)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        return {
+            **ids,
+            "matches": {
+                "insured": asdict(insured_match) if insured_match else None,
+                "patient": asdict(patient_match) if patient_match else None,
+            },
+        }
+
+    def stats(self) -> dict[str, Any]:
+        """ Index sizes """
+        return {"warm": self.warm, "insured": len(self.insured), "patients": len(self.patients)}
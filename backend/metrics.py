@@ -0,0 +1,225 @@
+""" Lightweight Prometheus metrics and optional OpenTelemetry spans """
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator, Optional
+from urllib.parse import unquote
+
+import httpx
+
+try:
+    from opentelemetry import trace
+    tracer = trace.get_tracer("reimbursement.backend")
+except ImportError:  # Tracing is optional
+    tracer = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """ Base class: a named metric with a fixed set of label names """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """ Monotonic counter """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, labelvalues: tuple[str, ...] = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            return self.header() + [
+                f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+                for labels, value in sorted(self._values.items())
+            ]
+
+
+class Gauge(_Metric):
+    """ Value that goes up and down, or is read from a callback at scrape time """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, labelvalues: tuple[str, ...] = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, labelvalues: tuple[str, ...] = (), amount: float = 1.0):
+        self.inc(labelvalues, -amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """ Report function() at scrape time instead of a stored value """
+        self._function = function
+
+    def render(self) -> list[str]:
+        if self._function is not None:
+            return self.header() + [f"{self.name} {float(self._function())}"]
+        with self._lock:
+            return self.header() + [
+                f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+                for labels, value in sorted(self._values.items())
+            ]
+
+
+class Histogram(_Metric):
+    """ Cumulative histogram with fixed buckets """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts incl. +Inf, sum)
+        self._values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+
+    def observe(self, value: float, labelvalues: tuple[str, ...] = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labelvalues, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._values[labelvalues] = (counts, total + value)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_label = f'le="{le}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, bucket_label)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """ Collection of metrics rendered together in the Prometheus text format """
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "ingestion_stage_seconds", "Time spent in each ingestion stage.", ("stage",)))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "ingestion_stage_errors_total", "Ingestion stage failures.", ("stage",)))
+STAGE_IN_FLIGHT = REGISTRY.register(Gauge(
+    "ingestion_stage_in_flight", "Documents currently in each ingestion stage.", ("stage",)))
+
+DB_SECONDS = REGISTRY.register(Histogram(
+    "db_request_seconds", "PostgREST round-trip time per table and operation.", ("table", "operation")))
+DB_ERRORS = REGISTRY.register(Counter(
+    "db_request_errors_total", "Failed PostgREST requests per table and operation.", ("table", "operation")))
+DB_IN_FLIGHT = REGISTRY.register(Gauge(
+    "db_requests_in_flight", "PostgREST requests currently in flight.", ("table", "operation")))
+
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "http_request_seconds", "API request latency per route.", ("method", "route", "status")))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "job_queue_depth", "Documents waiting for an upload worker."))
+
+SERVICE_RETRIES = REGISTRY.register(Counter(
+    "external_service_retries_total", "Retried calls to external services per error type.", ("service", "operation", "error")))
+SERVICE_THROTTLE_SECONDS = REGISTRY.register(Histogram(
+    "external_service_throttle_seconds", "Time calls waited for an external service rate limit token.", ("service", "operation")))
+LANDINGAI_CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    "landingai_circuit_open", "1 while the LandingAI circuit breaker is rejecting calls."))
+
+
+@contextmanager
+def track(histogram: Histogram, errors: Counter, in_flight: Gauge, labels: tuple[str, ...],
+          span_name: Optional[str] = None) -> Iterator[None]:
+    """ Time a block into histogram, count failures and track it as in flight """
+    in_flight.inc(labels)
+    started = time.perf_counter()
+    span = tracer.start_as_current_span(span_name) if tracer is not None and span_name else nullcontext()
+    try:
+        with span:
+            yield
+    except BaseException:
+        errors.inc(labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, labels)
+        in_flight.dec(labels)
+
+
+@contextmanager
+def track_stage(stage: str, timings: Optional[dict[str, float]] = None) -> Iterator[None]:
+    """ Time an ingestion stage, optionally recording its duration into timings[stage] """
+    started = time.perf_counter()
+    try:
+        with track(STAGE_SECONDS, STAGE_ERRORS, STAGE_IN_FLIGHT, (stage,), f"ingestion.{stage}"):
+            yield
+    finally:
+        if timings is not None:
+            timings[stage] = time.perf_counter() - started
+
+
+OPERATIONS = {"GET": "select", "HEAD": "select", "POST": "insert", "PATCH": "update", "PUT": "upsert", "DELETE": "delete"}
+
+
+def postgrest_labels(request: httpx.Request) -> tuple[str, str]:
+    """ (table, operation) for a PostgREST request, e.g. /rest/v1/Claims or /rest/v1/rpc/<function> """
+    parts = unquote(request.url.path).rstrip("/").split("/")
+    if len(parts) >= 2 and parts[-2] == "rpc":
+        return parts[-1], "rpc"
+    return parts[-1] if parts else "", OPERATIONS.get(request.method, request.method.lower())
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """ httpx transport wrapper that records every database round trip """
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        labels = postgrest_labels(request)
+        with track(DB_SECONDS, DB_ERRORS, DB_IN_FLIGHT, labels, f"db.{labels[1]} {labels[0]}"):
+            response = self.transport.handle_request(request)
+            if response.status_code >= 400:
+                DB_ERRORS.inc(labels)
+            return response
+
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,249 @@
+""" Contract pricing rules: an in-memory index for computing expected reimbursement """
+import asyncio
+import logging
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y")
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """ Parse an ISO or MM/DD/YYYY date (or a timestamp's date part); None if unparseable """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    text = str(value).strip()[:10]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_payer(payer: str) -> str:
+    """ Payer names are matched case- and whitespace-insensitively """
+    return " ".join(str(payer).split()).casefold()
+
+
+@dataclass(frozen=True)
+class Rate:
+    """ One pricing rule, resolved against its contract's payer and effective dates """
+    rule_id: int
+    contract_id: int
+    contract_number: str
+    procedure_name: Optional[str]
+    reimbursement_rate: float
+    unit: str
+    effective_date: date
+    expiration_date: date
+
+    def expected(self, billed_amount: Optional[float]) -> Optional[float]:
+        """ Fixed rates pay the rate; percentage rates pay that share of the billed amount """
+        if self.unit == "percentage":
+            if billed_amount is None:
+                return None
+            return round(float(billed_amount) * self.reimbursement_rate / 100, 2)
+        return round(self.reimbursement_rate, 2)
+
+
+class PricingIndex:
+    """
+    Pricing rules keyed by (payer, procedure_code), each holding its rates sorted by
+    effective date, so a lookup is one dict access plus a binary search on the date.
+    When contracts overlap, the one that took effect most recently wins.
+    """
+    def __init__(self, contracts: Iterable[dict[str, Any]], rules: Iterable[dict[str, Any]]):
+        contracts_by_id = {}
+        for contract in contracts:
+            if contract.get("status") == "pending":
+                continue
+            effective, expiration = parse_date(contract.get("effective_date")), parse_date(contract.get("expiration_date"))
+            if effective is None or expiration is None:
+                logger.warning("Skipping contract %s with unparseable dates", contract.get("id"))
+                continue
+            contracts_by_id[contract["id"]] = (contract, effective, expiration)
+
+        rates: dict[tuple[str, int], list[Rate]] = {}
+        self.rule_count = 0
+        for rule in rules:
+            entry = contracts_by_id.get(rule.get("contract_id"))
+            if entry is None:
+                continue
+            contract, effective, expiration = entry
+            key = (normalize_payer(contract["payer_name"]), int(rule["procedure_code"]))
+            rates.setdefault(key, []).append(Rate(
+                rule_id=rule["id"],
+                contract_id=contract["id"],
+                contract_number=contract.get("contract_number", ""),
+                procedure_name=rule.get("procedure_name"),
+                reimbursement_rate=float(rule["reimbursement_rate"]),
+                unit=rule["unit"],
+                effective_date=effective,
+                expiration_date=expiration,
+            ))
+            self.rule_count += 1
+
+        # key -> (sorted effective dates, rates in the same order)
+        self._rates: dict[tuple[str, int], tuple[list[date], list[Rate]]] = {}
+        for key, key_rates in rates.items():
+            key_rates.sort(key=lambda rate: (rate.effective_date, rate.rule_id))
+            self._rates[key] = ([rate.effective_date for rate in key_rates], key_rates)
+
+    def __len__(self) -> int:
+        return self.rule_count
+
+    def lookup(self, payer: str, procedure_code: int, date_of_service: Any = None) -> Optional[Rate]:
+        """ The rate in force for a payer and procedure on date_of_service (today if omitted) """
+        entry = self._rates.get((normalize_payer(payer), int(procedure_code)))
+        if entry is None:
+            return None
+        service_date = parse_date(date_of_service) if date_of_service is not None else date.today()
+        if service_date is None:
+            return None
+        starts, key_rates = entry
+        # Latest rate that started on or before the service date and has not expired by then
+        for position in range(bisect_right(starts, service_date) - 1, -1, -1):
+            if key_rates[position].expiration_date >= service_date:
+                return key_rates[position]
+        return None
+
+    def expected(self, payer: str, procedure_code: int, date_of_service: Any, billed_amount: Optional[float]) -> Optional[float]:
+        """ Expected reimbursement for one claim, or None when no rule applies """
+        rate = self.lookup(payer, procedure_code, date_of_service)
+        return rate.expected(billed_amount) if rate is not None else None
+
+    def reprice(self, claims: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Compute expected reimbursement for many claims at once.
+        Claims are grouped by (payer, procedure_code) and sorted by date of service, then
+        merged against that key's rates in one pass, instead of searching once per claim.
+        Returns {"id", "expected"} for every claim whose expected amount changes.
+        """
+        groups: dict[tuple[str, int], list[tuple[date, dict[str, Any]]]] = {}
+        for claim in claims:
+            service_date = parse_date(claim.get("date_of_service"))
+            if service_date is None or claim.get("procedure_code") is None or not claim.get("payer"):
+                continue
+            key = (normalize_payer(claim["payer"]), int(claim["procedure_code"]))
+            if key in self._rates:
+                groups.setdefault(key, []).append((service_date, claim))
+
+        updates = []
+        for key, group in groups.items():
+            starts, key_rates = self._rates[key]
+            group.sort(key=lambda item: item[0])
+            position = -1
+            for service_date, claim in group:
+                while position + 1 < len(starts) and starts[position + 1] <= service_date:
+                    position += 1
+                rate = next((key_rates[i] for i in range(position, -1, -1) if key_rates[i].expiration_date >= service_date), None)
+                if rate is None:
+                    continue
+                expected = rate.expected(claim.get("billed_amount"))
+                if expected is not None and (claim.get("expected") is None or abs(float(claim["expected"]) - expected) >= 0.005):
+                    updates.append({"id": claim["id"], "expected": expected})
+        return updates
+
+
+def fetch_all(fetch_page: Callable, page_size: int = 1000) -> list[dict[str, Any]]:
+    """
+    Every row of a keyset-paginated table, via fetch_page(after, limit).
+    Only an empty page ends it: PostgREST caps each response at its max-rows setting,
+    so a short page is not necessarily the last.
+    """
+    rows = []
+    after = None
+    while True:
+        page = fetch_page(after, page_size).data
+        if not page:
+            return rows
+        rows.extend(page)
+        after = page[-1]["id"]
+
+
+class PricingEngine:
+    """
+    Holds the current PricingIndex and rebuilds it when contracts or rules change.
+    Readers always see a complete index: a reload builds a new one and swaps it in.
+    """
+    def __init__(self, database, reload_seconds: float = 60.0):
+        self.database = database
+        self.reload_seconds = reload_seconds
+        self.index = PricingIndex([], [])
+        self.version: Optional[str] = None
+        self.loaded_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def reload(self, force: bool = True) -> bool:
+        """ Rebuild the index from the database; unless forced, only when the rules version changed """
+        with self._lock:
+            version = self.database.get_pricing_rules_version()
+            if not force and version == self.version:
+                return False
+            contracts = fetch_all(self.database.get_contracts_page)
+            rules = fetch_all(self.database.get_pricing_rules_page)
+            self.index = PricingIndex(contracts, rules)
+            self.version = version
+            self.loaded_at = datetime.now()
+        logger.info("Loaded %s pricing rules from %s contracts", len(self.index), len(contracts))
+        return True
+
+    async def start(self):
+        """ Load the index and start polling for rule changes """
+        try:
+            await asyncio.to_thread(self.reload)
+        except Exception as e:
+            logger.error("Failed to load pricing rules: %s", str(e))
+        if self.reload_seconds > 0:
+            self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        """ Stop polling """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await asyncio.to_thread(self.reload, False)
+            except Exception as e:
+                logger.error("Failed to reload pricing rules: %s", str(e))
+
+    def stats(self) -> dict[str, Any]:
+        """ Size and freshness of the loaded index """
+        return {"rules": len(self.index), "version": self.version, "loaded_at": self.loaded_at}
+
+
+REPRICE_COLUMNS = ["id", "payer", "procedure_code", "date_of_service", "billed_amount", "expected"]
+
+
+def reprice_claims(database, index: PricingIndex, payer: Optional[str] = None, page_size: int = 5000,
+                   date_from: Optional[str] = None, date_to: Optional[str] = None) -> dict[str, Any]:
+    """ Recompute expected reimbursement for every matching claim, page by page, writing back only changes """
+    scanned = 0
+    updated = 0
+    after = None
+    while True:
+        page = database.get_claims_page(after, page_size, REPRICE_COLUMNS, payer=payer, date_from=date_from, date_to=date_to).data
+        if not page:
+            break
+        scanned += len(page)
+        updates = index.reprice(page)
+        if updates:
+            updated += database.bulk_update_claims(updates)
+        after = page[-1]["id"]
+    logger.info("Repriced claims: scanned %s, updated %s", scanned, updated)
+    return {"scanned": scanned, "updated": updated}
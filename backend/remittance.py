@@ -0,0 +1,193 @@
+""" Streaming ingestion of 835 (ERA) remittance files into claim payments """
+import logging
+import time
+from dataclasses import dataclass
+from typing import IO, Any, Iterator, Optional
+
+from database import ClaimStatus
+
+logger = logging.getLogger(__name__)
+
+CHUNK_BYTES = 64 * 1024
+ISA_LENGTH = 106
+# CLP02 claim status codes: processed as primary/secondary/tertiary (incl. forwarded), denied
+PAID_STATUS_CODES = {"1", "2", "3", "19", "20", "21"}
+DENIED_STATUS_CODES = {"4"}
+MAX_REPORTED_UNMATCHED = 1000
+
+
+class RemittanceError(Exception):
+    """ Raised when a file is not a readable 835 """
+
+
+@dataclass
+class Remit:
+    """ One claim payment (CLP segment) from a remittance """
+    claim_id: str
+    status_code: str
+    charged: Optional[float]
+    paid: Optional[float]
+    payer: Optional[str] = None
+    check_number: Optional[str] = None
+
+    @property
+    def status(self) -> Optional[ClaimStatus]:
+        """ Claim status this remit implies; None for codes we don't post (e.g. 22, reversal) """
+        if self.status_code in DENIED_STATUS_CODES:
+            return ClaimStatus.DENIED
+        if self.status_code in PAID_STATUS_CODES:
+            return ClaimStatus.PAID if self.paid else ClaimStatus.DENIED
+        return None
+
+
+def _amount(value: str) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def check_header(stream: IO[bytes]):
+    """ Raise RemittanceError unless the stream starts with an ISA header; leaves the stream at the start """
+    header = stream.read(ISA_LENGTH * 2).decode("latin-1").lstrip()
+    stream.seek(0)
+    if not header.startswith("ISA") or len(header) < ISA_LENGTH or header[ISA_LENGTH - 1] in "\r\n":
+        raise RemittanceError("File is not an X12 835: it does not start with an ISA header")
+
+
+def iter_segments(stream: IO[bytes], chunk_bytes: int = CHUNK_BYTES) -> Iterator[list[str]]:
+    """
+    Yield each segment of an X12 file as a list of elements, reading chunk by chunk.
+    The element separator and segment terminator are taken from the fixed-width ISA header.
+    """
+    buffer = stream.read(max(chunk_bytes, ISA_LENGTH)).decode("latin-1").lstrip()
+    if not buffer.startswith("ISA") or len(buffer) < ISA_LENGTH:
+        raise RemittanceError("File does not start with an ISA header")
+    element_separator = buffer[3]
+    terminator = buffer[ISA_LENGTH - 1]
+    if terminator in "\r\n":
+        raise RemittanceError("Could not determine the segment terminator")
+
+    while True:
+        *segments, buffer = buffer.split(terminator)
+        for segment in segments:
+            segment = segment.strip()
+            if segment:
+                yield segment.split(element_separator)
+        chunk = stream.read(chunk_bytes)
+        if not chunk:
+            break
+        buffer += chunk.decode("latin-1")
+    if buffer.strip():
+        yield buffer.strip().split(element_separator)
+
+
+def iter_remits(segments: Iterator[list[str]]) -> Iterator[Remit]:
+    """ Yield a Remit per CLP segment, carrying the payer (N1*PR) and check number (TRN) of its transaction """
+    payer = None
+    check_number = None
+    for elements in segments:
+        segment_id = elements[0]
+        if segment_id == "ST":
+            payer = check_number = None
+        elif segment_id == "TRN" and len(elements) > 2:
+            check_number = elements[2]
+        elif segment_id == "N1" and len(elements) > 2 and elements[1] == "PR":
+            payer = elements[2]
+        elif segment_id == "CLP" and len(elements) > 4:
+            yield Remit(
+                claim_id=elements[1].strip(),
+                status_code=elements[2].strip(),
+                charged=_amount(elements[3]),
+                paid=_amount(elements[4]),
+                payer=payer,
+                check_number=check_number,
+            )
+
+
+class RemittanceReport:
+    """ Counters and unmatched records for one file """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.started = time.perf_counter()
+        self.remits = 0
+        self.matched = 0
+        self.updated = 0
+        self.skipped = 0
+        self.unmatched = 0
+        self.unmatched_records: list[dict[str, Any]] = []
+
+    def add_unmatched(self, remit: Remit, reason: str):
+        self.unmatched += 1
+        if len(self.unmatched_records) < MAX_REPORTED_UNMATCHED:
+            self.unmatched_records.append({
+                "claim_id": remit.claim_id,
+                "status_code": remit.status_code,
+                "paid": remit.paid,
+                "payer": remit.payer,
+                "check_number": remit.check_number,
+                "reason": reason,
+            })
+
+    def to_dict(self, bytes_read: int) -> dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "filename": self.filename,
+            "bytes": bytes_read,
+            "remits": self.remits,
+            "matched": self.matched,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "unmatched": self.unmatched,
+            "unmatched_records": self.unmatched_records,
+            "unmatched_truncated": self.unmatched > len(self.unmatched_records),
+            "elapsed_seconds": elapsed,
+            "remits_per_second": self.remits / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def _apply_batch(database, batch: dict[str, Remit], report: RemittanceReport):
+    """ Look up a batch of remits by claim_id and post their status and paid amount in one write """
+    ids_by_claim_id: dict[str, list[int]] = {}
+    for claim in database.get_claims_by_claim_ids(list(batch), ["id", "claim_id"]):
+        ids_by_claim_id.setdefault(claim["claim_id"], []).append(claim["id"])
+
+    updates = []
+    for claim_id, remit in batch.items():
+        ids = ids_by_claim_id.get(claim_id)
+        if not ids:
+            report.add_unmatched(remit, "no claim with this claim_id")
+        elif len(ids) > 1:
+            report.add_unmatched(remit, f"{len(ids)} claims share this claim_id")
+        else:
+            report.matched += 1
+            updates.append({"id": ids[0], "actual": remit.paid or 0.0, "status": remit.status})
+    if updates:
+        report.updated += database.bulk_update_claims(updates)
+
+
+def ingest_remittance(database, stream: IO[bytes], filename: str, batch_size: int = 1000) -> dict[str, Any]:
+    """
+    Parse an 835 file with constant memory and post each claim payment to its claim.
+    Remits are matched by claim_id and written batch_size at a time; within a batch the
+    last remit for a claim wins. Returns throughput and the remits that matched no claim.
+    """
+    report = RemittanceReport(filename)
+    batch: dict[str, Remit] = {}
+    for remit in iter_remits(iter_segments(stream)):
+        report.remits += 1
+        if not remit.claim_id or remit.status is None:
+            report.skipped += 1
+            continue
+        batch.pop(remit.claim_id, None)
+        batch[remit.claim_id] = remit
+        if len(batch) >= batch_size:
+            _apply_batch(database, batch, report)
+            batch = {}
+    if batch:
+        _apply_batch(database, batch, report)
+
+    result = report.to_dict(stream.tell())
+    logger.info("Remittance %s: %s remits, %s updated, %s unmatched, %s skipped in %.2fs",
+                filename, report.remits, report.updated, report.unmatched, report.skipped, result["elapsed_seconds"])
+    return result
@@ -0,0 +1,227 @@
+""" Rate limiting, retries and circuit breaking for calls to external services """
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Optional, TypeVar
+
+from metrics import SERVICE_RETRIES, SERVICE_THROTTLE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ServiceUnavailableError(Exception):
+    """ Raised instead of calling a service that is failing or over its rate limit """
+    def __init__(self, name: str, retry_after: float, reason: str):
+        super().__init__(f"{name} is unavailable ({reason}); retry in {max(1, round(retry_after))}s")
+        self.retry_after = retry_after
+
+
+class RateLimitTimeout(Exception):
+    """ Raised when a rate limiter token could not be acquired in time """
+
+
+class TokenBucket:
+    """ Thread-safe token bucket: `rate` tokens per second, holding at most `burst` """
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {"rate_per_second": self.rate, "burst": self.burst, "tokens": self._tokens}
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """ Block until a token is available; returns seconds waited. Raises RateLimitTimeout after timeout """
+        if self.rate <= 0:
+            return 0.0
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return now - started
+                wait = (1 - self._tokens) / self.rate
+            if timeout is not None and now - started + wait > timeout:
+                raise RateLimitTimeout(f"No rate limit token within {timeout}s")
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_seconds`;
+    then lets one trial call through (half-open) and closes again if it succeeds.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """ Seconds until the breaker lets a call through; 0 when it would now """
+        with self._lock:
+            if self.state == self.OPEN:
+                return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+            if self.state == self.HALF_OPEN and self._trial_in_flight:
+                return 1.0
+            return 0.0
+
+    def before_call(self):
+        """ Raise ServiceUnavailableError unless a call may proceed """
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    raise ServiceUnavailableError(self.name, remaining, "circuit open")
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    raise ServiceUnavailableError(self.name, 1.0, "circuit half-open")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuit %s closed", self.name)
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release(self):
+        """ Give back a half-open trial slot without recording an outcome """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Circuit %s opened after %s consecutive failures", self.name, self._failures)
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def is_open(self) -> bool:
+        return self.retry_after() > 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._failures}
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """ Full-jitter exponential backoff for the given (0-based) retry attempt """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_with_retries(
+    func: Callable[[], T],
+    is_transient: Callable[[Exception], bool],
+    max_retries: int,
+    base_delay: float,
+    max_delay: float,
+    retry_after: Callable[[Exception], Optional[float]] = lambda e: None,
+    on_retry: Callable[[int, Exception, float], None] = lambda attempt, e, delay: None,
+) -> T:
+    """
+    Call func, retrying transient failures with jittered exponential backoff.
+    A server-provided Retry-After (from retry_after(e)) is honoured when it is longer than the backoff.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_retries or not is_transient(e):
+                raise
+            delay = max(backoff_delay(attempt, base_delay, max_delay), min(retry_after(e) or 0.0, max_delay))
+            on_retry(attempt + 1, e, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+class ServiceGuard:
+    """
+    Wraps every call to one external service: fails fast while the circuit breaker is open,
+    waits for a rate limit token before each attempt, and retries transient failures with
+    jittered backoff. Only transient failures that survive their retries count against the breaker.
+    """
+    def __init__(self, name: str, limiter: TokenBucket, breaker: CircuitBreaker,
+                 is_transient: Callable[[Exception], bool],
+                 retry_after: Callable[[Exception], Optional[float]] = lambda e: None,
+                 max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0,
+                 max_rate_wait: float = 60.0):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.is_transient = is_transient
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_rate_wait = max_rate_wait
+
+    def _attempt(self, operation: str, func: Callable[[], T]) -> T:
+        try:
+            waited = self.limiter.acquire(self.max_rate_wait)
+        except RateLimitTimeout as e:
+            raise ServiceUnavailableError(self.name, self.max_rate_wait, "rate limit") from e
+        if waited:
+            SERVICE_THROTTLE_SECONDS.observe(waited, (self.name, operation))
+        return func()
+
+    def call(self, operation: str, func: Callable[[], T]) -> T:
+        """ Run func (one request to the service) under the rate limit, breaker and retry policy """
+        def on_retry(attempt: int, e: Exception, delay: float):
+            SERVICE_RETRIES.inc((self.name, operation, type(e).__name__))
+            logger.warning("%s %s failed (%s), retry %s/%s in %.2fs",
+                           self.name, operation, str(e) or type(e).__name__, attempt, self.max_retries, delay)
+
+        self.breaker.before_call()
+        try:
+            result = call_with_retries(
+                lambda: self._attempt(operation, func), self.is_transient,
+                self.max_retries, self.base_delay, self.max_delay, self.retry_after, on_retry,
+            )
+        except ServiceUnavailableError:
+            # Our own limiter gave up; says nothing about the service's health
+            self.breaker.release()
+            raise
+        except Exception as e:
+            if self.is_transient(e):
+                self.breaker.record_failure()
+            else:
+                # The service answered; a bad request is not a sign it is degraded
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "circuit": {**self.breaker.stats(), "retry_after_seconds": self.breaker.retry_after()},
+            "rate_limit": self.limiter.stats(),
+            "max_retries": self.max_retries,
+        }
@@ -0,0 +1,72 @@
+""" Splitting a parsed multi-form document into one segment per claim form """
+import re
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+# Title block printed at the top of every CMS-1500 / HCFA claim form
+FORM_HEADER_PATTERN = re.compile(
+    r"HEALTH\s+INSURANCE\s+CLAIM\s+FORM|\bCMS[\s-]*1500\b|\bHCFA[\s-]*1500\b", re.IGNORECASE)
+# Only the top of a page counts, so a form that mentions the title in its body doesn't start a new one
+HEADER_SEARCH_CHARS = 1500
+
+
+@dataclass
+class Page:
+    """ Markdown of one parsed page """
+    number: int
+    markdown: str
+
+
+@dataclass
+class Segment:
+    """ Consecutive pages that make up one claim form """
+    index: int
+    pages: list[Page] = field(default_factory=list)
+
+    @property
+    def page_numbers(self) -> list[int]:
+        return [page.number for page in self.pages]
+
+    @property
+    def markdown(self) -> str:
+        return "\n\n".join(page.markdown for page in self.pages)
+
+
+def pages_from_splits(splits: list[Any]) -> list[Page]:
+    """ Pages from a parse response made with split="page" (one split per page) """
+    pages = []
+    for position, split in enumerate(splits):
+        numbers = getattr(split, "pages", None) or [position]
+        pages.append(Page(number=numbers[0], markdown=split.markdown))
+    return pages
+
+
+def starts_form(page: Page) -> bool:
+    return bool(FORM_HEADER_PATTERN.search(page.markdown[:HEADER_SEARCH_CHARS]))
+
+
+def split_forms(pages: list[Page], pages_per_form: Optional[int] = None) -> list[Segment]:
+    """
+    Group pages into forms. With pages_per_form, every pages_per_form pages make a form.
+    Otherwise a page carrying a claim form title starts a new form and the pages after it
+    (continuation pages, attachments) belong to it; pages before the first title join the
+    first form. A document with no recognizable title is treated as one form per page.
+    """
+    if not pages:
+        return []
+    if pages_per_form is None and not any(starts_form(page) for page in pages):
+        pages_per_form = 1
+
+    segments: list[Segment] = []
+    has_header = False
+    for position, page in enumerate(pages):
+        if pages_per_form is not None:
+            new_form = position % pages_per_form == 0
+        else:
+            header = starts_form(page)
+            new_form = header and has_header
+            has_header = has_header or header
+        if not segments or new_form:
+            segments.append(Segment(index=len(segments)))
+        segments[-1].pages.append(page)
+    return segments
@@ -0,0 +1,107 @@
+-- Per payer/month claim aggregates kept up to date by a trigger on "Claims",
+-- so /analytics reads a handful of rollup rows instead of scanning every claim.
+create table if not exists "Claim_Rollups" (
+    payer text not null,
+    month text not null, -- YYYY-MM of date_of_service, or 'unknown' (see claim_month)
+    claims bigint not null default 0,
+    processing_claims bigint not null default 0,
+    paid_claims bigint not null default 0,
+    denied_claims bigint not null default 0,
+    billed_amount numeric not null default 0,
+    expected_amount numeric not null default 0,
+    processed_expected_amount numeric not null default 0, -- expected of paid + denied claims
+    actual_amount numeric not null default 0,
+    primary key (payer, month)
+);
+
+-- YYYY-MM of a free-text date_of_service, or 'unknown' when it isn't a date, so one
+-- unparseable date can't abort a Claims write.
+create or replace function public.claim_month(date_of_service text)
+returns text
+language plpgsql
+stable
+as $$
+begin
+    return coalesce(to_char(date_of_service::date, 'YYYY-MM'), 'unknown');
+exception when data_exception then
+    return 'unknown';
+end;
+$$;
+
+create or replace function public.apply_claim_rollup(claim "Claims", sign integer)
+returns void
+language sql
+as $$
+    insert into "Claim_Rollups" as r (
+        payer, month, claims, processing_claims, paid_claims, denied_claims,
+        billed_amount, expected_amount, processed_expected_amount, actual_amount
+    )
+    values (
+        claim.payer,
+        claim_month(claim.date_of_service),
+        sign,
+        sign * (claim.status = 'processing')::int,
+        sign * (claim.status = 'paid')::int,
+        sign * (claim.status = 'denied')::int,
+        sign * coalesce(claim.billed_amount, 0),
+        sign * coalesce(claim.expected, 0),
+        sign * case when claim.status in ('paid', 'denied') then coalesce(claim.expected, 0) else 0 end,
+        sign * coalesce(claim.actual, 0)
+    )
+    on conflict (payer, month) do update set
+        claims = r.claims + excluded.claims,
+        processing_claims = r.processing_claims + excluded.processing_claims,
+        paid_claims = r.paid_claims + excluded.paid_claims,
+        denied_claims = r.denied_claims + excluded.denied_claims,
+        billed_amount = r.billed_amount + excluded.billed_amount,
+        expected_amount = r.expected_amount + excluded.expected_amount,
+        processed_expected_amount = r.processed_expected_amount + excluded.processed_expected_amount,
+        actual_amount = r.actual_amount + excluded.actual_amount;
+$$;
+
+create or replace function public.claims_rollup_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform apply_claim_rollup(old, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform apply_claim_rollup(new, 1);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists claims_rollup on "Claims";
+create trigger claims_rollup
+after insert or update or delete on "Claims"
+for each row execute function public.claims_rollup_trigger();
+
+-- Rebuild every rollup from scratch (initial backfill or repair).
+create or replace function public.refresh_claim_rollups()
+returns void
+language sql
+as $$
+    truncate "Claim_Rollups";
+    insert into "Claim_Rollups" (
+        payer, month, claims, processing_claims, paid_claims, denied_claims,
+        billed_amount, expected_amount, processed_expected_amount, actual_amount
+    )
+    select
+        payer,
+        claim_month(date_of_service),
+        count(*),
+        count(*) filter (where status = 'processing'),
+        count(*) filter (where status = 'paid'),
+        count(*) filter (where status = 'denied'),
+        coalesce(sum(billed_amount), 0),
+        coalesce(sum(expected), 0),
+        coalesce(sum(expected) filter (where status in ('paid', 'denied')), 0),
+        coalesce(sum(actual), 0)
+    from "Claims"
+    group by 1, 2;
+$$;
+
+select refresh_claim_rollups();
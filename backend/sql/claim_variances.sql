@@ -0,0 +1,66 @@
+-- Underpayment detection: claims carry an updated_at so each run only scans
+-- what changed since the previous one, and flagged claims are kept in
+-- "Claim_Variances" so dashboards never scan "Claims".
+alter table "Claims" add column if not exists updated_at timestamptz not null default now();
+create index if not exists claims_updated_at on "Claims" (updated_at, id);
+
+create or replace function public.touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists claims_touch on "Claims";
+create trigger claims_touch before update on "Claims"
+for each row execute function public.touch_updated_at();
+
+-- Per payer thresholds; the row for payer '*' applies to payers without their own.
+-- A claim is flagged when expected - actual is at least min_amount AND at least
+-- min_percent of expected.
+create table if not exists "Variance_Thresholds" (
+    payer text primary key,
+    min_amount numeric not null default 0,
+    min_percent numeric not null default 0
+);
+
+-- One row per currently underpaid claim; id is the "Claims" id.
+create table if not exists "Claim_Variances" (
+    id bigint primary key references "Claims" (id) on delete cascade,
+    claim_id text not null,
+    payer text not null,
+    procedure_code bigint,
+    date_of_service date,
+    expected numeric not null,
+    actual numeric not null,
+    variance numeric not null,
+    variance_percent numeric not null,
+    detected_at timestamptz not null default now()
+);
+
+create index if not exists claim_variances_payer on "Claim_Variances" (payer, id);
+create index if not exists claim_variances_variance on "Claim_Variances" (variance desc);
+
+create table if not exists "Variance_Runs" (
+    id bigint generated by default as identity primary key,
+    started_at timestamptz not null,
+    finished_at timestamptz not null default now(),
+    scanned_from timestamptz,
+    scanned_to timestamptz not null, -- the next run starts here
+    scanned bigint not null default 0,
+    flagged bigint not null default 0,
+    cleared bigint not null default 0
+);
+
+create or replace view "Variance_Summary" as
+    select payer,
+           count(*) as underpaid_claims,
+           sum(expected) as expected_amount,
+           sum(actual) as actual_amount,
+           sum(variance) as variance_amount,
+           max(detected_at) as last_detected_at
+    from "Claim_Variances"
+    group by payer;
@@ -0,0 +1,99 @@
+-- Insert a full claim-form extraction (other insurance, insured, attestation, patient)
+-- in one round trip and one transaction. Called via Database.create_claim_form_extraction.
+-- When existing_insured_id / existing_patient_id are given (the form matched people already
+-- on file) those rows are linked instead of inserting duplicates. The form's own attestation
+-- and other insurance are always inserted; a matched patient or insured is relinked to them
+-- (and a matched patient to the form's insured), so the latest form wins and earlier
+-- attestation / other insurance rows are kept. An insured that matched no one is inserted
+-- even when the patient matched: the patient's previous insured is not the form's.
+drop function if exists public.create_claim_form_extraction(jsonb);
+create or replace function public.create_claim_form_extraction(
+    extraction jsonb,
+    existing_insured_id bigint default null,
+    existing_patient_id bigint default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    other_insurance jsonb := nullif(extraction -> 'otherInsuranceInformation', 'null'::jsonb);
+    v_other_insurance_id bigint;
+    v_insured_id bigint := existing_insured_id;
+    v_attestation_id bigint;
+    v_patient_id bigint := existing_patient_id;
+begin
+    if other_insurance is not null then
+        insert into "Other_Insurance_Information" (
+            policy_holder_insurance_last_name, policy_holder_insurance_first_name,
+            policy_holder_insurance_middle_initial, policy_holder_insurance_date_of_birth,
+            policy_holder_identification_number, policy_holder_insurance_plan_name,
+            policy_holder_insurance_gender, policy_holder_phone_number, policy_holder_employer_name
+        )
+        select
+            policy_holder_insurance_last_name, policy_holder_insurance_first_name,
+            policy_holder_insurance_middle_initial, policy_holder_insurance_date_of_birth,
+            policy_holder_identification_number, policy_holder_insurance_plan_name,
+            policy_holder_insurance_gender, policy_holder_phone_number, policy_holder_employer_name
+        from jsonb_populate_record(null::"Other_Insurance_Information", other_insurance)
+        returning id into v_other_insurance_id;
+
+        if v_insured_id is not null then
+            update "Insured_Information"
+            set other_identification_number = v_other_insurance_id
+            where id = v_insured_id;
+        end if;
+    end if;
+
+    insert into "Attestation" (
+        date_of_patient_signed, provider_name, tax_number, npi_number, date_of_insured_signed
+    )
+    select
+        date_of_patient_signed, provider_name, tax_number, npi_number, date_of_insured_signed
+    from jsonb_populate_record(null::"Attestation", extraction -> 'attestation')
+    returning id into v_attestation_id;
+
+    if v_insured_id is null then
+        insert into "Insured_Information" (
+            last_name, first_name, middle_initial, date_of_birth, identification_number, gender,
+            address, city, state, zip, phone, employer_name, insurance_plan_name,
+            another_insurance_plan, other_identification_number
+        )
+        select
+            last_name, first_name, middle_initial, date_of_birth, identification_number, gender,
+            address, city, state, zip, phone, employer_name, insurance_plan_name,
+            coalesce(another_insurance_plan, false), v_other_insurance_id
+        from jsonb_populate_record(null::"Insured_Information", extraction -> 'insuredInformation')
+        returning id into v_insured_id;
+    end if;
+
+    if v_patient_id is null then
+        insert into "Patient_Information" (
+            insured_id, patient_last_name, patient_first_name, patient_middle_initial,
+            patient_date_of_birth, patient_gender, patient_address, patient_city, patient_state,
+            patient_zip, patient_phone, status, relationship_to_insured,
+            condition_related_to_employment, condition_related_to_auto_accident,
+            date_of_current_illness, condition_related_to_other, auto_accident_place, attestation_id
+        )
+        select
+            v_insured_id, patient_last_name, patient_first_name, patient_middle_initial,
+            patient_date_of_birth, patient_gender, patient_address, patient_city, patient_state,
+            patient_zip, patient_phone, status, relationship_to_insured,
+            condition_related_to_employment, condition_related_to_auto_accident,
+            date_of_current_illness, condition_related_to_other, auto_accident_place, v_attestation_id
+        from jsonb_populate_record(null::"Patient_Information", extraction -> 'patientInformation')
+        returning id into v_patient_id;
+    else
+        update "Patient_Information"
+        set attestation_id = v_attestation_id,
+            insured_id = v_insured_id
+        where id = v_patient_id;
+    end if;
+
+    return jsonb_build_object(
+        'other_insurance_id', v_other_insurance_id,
+        'insured_id', v_insured_id,
+        'attestation_id', v_attestation_id,
+        'patient_id', v_patient_id
+    );
+end;
+$$;
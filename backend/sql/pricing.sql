@@ -0,0 +1,54 @@
+-- Payer contracts and their per-procedure pricing rules.
+create table if not exists "Contracts" (
+    id bigint generated by default as identity primary key,
+    payer_name text not null,
+    contract_number text not null,
+    effective_date date not null,
+    expiration_date date not null,
+    status text not null default 'active', -- active | pending | expired
+    document_url text,
+    updated_at timestamptz not null default now()
+);
+
+create table if not exists "Pricing_Rules" (
+    id bigint generated by default as identity primary key,
+    contract_id bigint not null references "Contracts" (id) on delete cascade,
+    procedure_code bigint not null,
+    procedure_name text,
+    reimbursement_rate numeric not null,
+    unit text not null, -- fixed | percentage
+    notes text,
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists pricing_rules_contract_id on "Pricing_Rules" (contract_id);
+
+create or replace function public.touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists contracts_touch on "Contracts";
+create trigger contracts_touch before update on "Contracts"
+for each row execute function public.touch_updated_at();
+
+drop trigger if exists pricing_rules_touch on "Pricing_Rules";
+create trigger pricing_rules_touch before update on "Pricing_Rules"
+for each row execute function public.touch_updated_at();
+
+-- Changes whenever a contract or rule is inserted, updated or deleted;
+-- the pricing engine polls this to know when to reload its index.
+create or replace function public.pricing_rules_version()
+returns text
+language sql
+stable
+as $$
+    select concat_ws(':',
+        (select count(*) from "Contracts"), (select max(updated_at) from "Contracts"),
+        (select count(*) from "Pricing_Rules"), (select max(updated_at) from "Pricing_Rules"));
+$$;
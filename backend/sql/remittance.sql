@@ -0,0 +1,2 @@
+-- Remittance posting looks claims up by their external claim_id (CLP01).
+create index if not exists claims_claim_id on "Claims" (claim_id);
@@ -0,0 +1,17 @@
+-- Apply many per-claim updates in one statement.
+-- updates is a JSON array of {"id", "expected"?, "actual"?, "status"?}; omitted keys keep their value.
+create or replace function public.update_claims(updates jsonb)
+returns integer
+language sql
+as $$
+    with changed as (
+        update "Claims" c set
+            expected = coalesce(u.expected, c.expected),
+            actual = coalesce(u.actual, c.actual),
+            status = coalesce(u.status, c.status)
+        from jsonb_to_recordset(updates) as u(id bigint, expected numeric, actual numeric, status text)
+        where c.id = u.id
+        returning 1
+    )
+    select count(*)::integer from changed;
+$$;
@@ -0,0 +1,5 @@
+""" Settings the backend modules read at import time; tests never reach Supabase """
+import os
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test")
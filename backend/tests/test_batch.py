@@ -0,0 +1,39 @@
+""" Expanding zip archives uploaded to /upload/batch """
+import io
+import zipfile
+
+import pytest
+
+from batch import ArchiveTooLarge, expand_upload
+from uploads import SpooledUpload
+
+
+def archive(members: dict[str, bytes], filename: str = "forms.zip") -> SpooledUpload:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in members.items():
+            zip_file.writestr(name, data)
+    return SpooledUpload(buffer, filename, buffer.tell(), "")
+
+
+def test_supported_members_are_expanded():
+    documents = expand_upload(archive({"a.pdf": b"a", "b/c.png": b"cc", "notes.md": b"x", ".hidden.pdf": b"x"}))
+    assert [(document.filename, document.size) for document in documents] == [("forms.zip/a.pdf", 1), ("forms.zip/b/c.png", 2)]
+
+
+def test_archive_with_too_many_members_is_rejected():
+    with pytest.raises(ArchiveTooLarge):
+        expand_upload(archive({f"{number}.pdf": b"x" for number in range(11)}), max_members=10)
+
+
+def test_archive_expanding_past_the_limit_is_rejected_before_decompressing():
+    document = archive({f"{number}.pdf": bytes(4 * 1024 * 1024) for number in range(3)})
+    assert document.size < 100 * 1024
+    with pytest.raises(ArchiveTooLarge):
+        expand_upload(document, max_expanded_bytes=10 * 1024 * 1024)
+    assert document.closed
+
+
+def test_non_archives_are_returned_as_is():
+    document = SpooledUpload(io.BytesIO(b"form"), "form.pdf", 4, "")
+    assert expand_upload(document, max_expanded_bytes=0) == [document]
@@ -0,0 +1,22 @@
+""" Streaming claim exports page by page """
+from types import SimpleNamespace
+
+from export import iter_claim_rows
+
+
+class FakeDatabase:
+    """ Like PostgREST, returns at most max_rows rows per request whatever the limit """
+    def __init__(self, claims: list[dict], max_rows: int):
+        self.claims = claims
+        self.max_rows = max_rows
+
+    def get_claims_page(self, after, limit, columns, status, payer, claim_id, date_from, date_to):
+        rows = [dict(claim) for claim in self.claims if after is None or claim["id"] > after]
+        return SimpleNamespace(data=rows[:min(limit, self.max_rows)])
+
+
+def test_exports_every_page_when_responses_are_capped_below_page_size():
+    claims = [{"id": claim_id, "claim_id": f"C{claim_id}"} for claim_id in range(1, 26)]
+    pages = list(iter_claim_rows(FakeDatabase(claims, max_rows=10), page_size=5000))
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [row["id"] for page in pages for row in page] == list(range(1, 26))
@@ -0,0 +1,70 @@
+""" Member matching: exact and fuzzy links between extracted forms and existing records """
+from types import SimpleNamespace
+
+from matching import MemberIndex, MemberMatcher, patient_member
+
+
+def patient(first_name: str, last_name: str = "O'Neil", date_of_birth: str = "1980-01-02",
+            address: str = "1 Main Street", zip_code: str = "33601") -> dict:
+    return {
+        "patient_first_name": first_name, "patient_last_name": last_name, "patient_date_of_birth": date_of_birth,
+        "patient_address": address, "patient_zip": zip_code,
+    }
+
+
+def index_with(*rows: dict) -> MemberIndex:
+    index = MemberIndex(threshold=0.9)
+    for member_id, row in enumerate(rows, start=1):
+        index.add(member_id, patient_member(row))
+    return index
+
+
+def test_household_members_with_different_first_names_are_not_linked():
+    index = index_with(patient("John"))
+    for first_name in ("Jane", "Joan", "Mary"):
+        assert index.match(patient_member(patient(first_name))) is None
+
+
+def test_twins_are_not_linked_to_each_other():
+    index = index_with(patient("John"), patient("Joan"))
+    assert index.match(patient_member(patient("Joan"))).id == 2
+    assert index.match(patient_member(patient("Jane"))) is None
+
+
+def test_first_name_typo_still_matches():
+    index = index_with(patient("John"))
+    match = index.match(patient_member(patient("Jon", last_name="ONeil")))
+    assert match is not None and match.id == 1 and match.method == "fuzzy"
+
+
+def test_initial_matches_full_first_name():
+    index = index_with(patient("John"))
+    match = index.match(patient_member(patient("J", last_name="O'Neill")))
+    assert match is not None and match.id == 1
+
+
+def test_exact_name_and_dob_match():
+    index = index_with(patient("John"))
+    match = index.match(patient_member(patient("JOHN", last_name="oneil", address="")))
+    assert match is not None and match.method == "name_dob"
+
+
+class FakeDatabase:
+    """ Like PostgREST, returns at most max_rows rows per request whatever the limit """
+    def __init__(self, patients: list[dict], max_rows: int):
+        self.patients = patients
+        self.max_rows = max_rows
+
+    def get_insured_information_page(self, after, limit, columns):
+        return SimpleNamespace(data=[])
+
+    def get_patient_information_page(self, after, limit, columns):
+        rows = [row for row in self.patients if after is None or row["id"] > after]
+        return SimpleNamespace(data=rows[:min(limit, self.max_rows)])
+
+
+def test_refresh_loads_every_page_when_responses_are_capped_below_page_size():
+    patients = [{"id": member_id, **patient("John", date_of_birth=f"1980-01-{member_id:02d}")} for member_id in range(1, 26)]
+    matcher = MemberMatcher(FakeDatabase(patients, max_rows=10), page_size=5000)
+    assert matcher.refresh() == {"insured": 0, "patients": 25}
+    assert matcher.patients.match(patient_member(patient("John", date_of_birth="1980-01-25"))).id == 25
@@ -0,0 +1,77 @@
+""" Loading the pricing index and repricing claims page by page """
+from types import SimpleNamespace
+
+from pricing import PricingEngine, reprice_claims
+
+
+def capped_page(rows: list[dict], after, limit, max_rows: int) -> SimpleNamespace:
+    """ Like PostgREST, at most max_rows rows per request whatever the limit """
+    rows = [row for row in rows if after is None or row["id"] > after]
+    return SimpleNamespace(data=rows[:min(limit, max_rows)])
+
+
+class FakeDatabase:
+    def __init__(self, contracts: list[dict], rules: list[dict], claims: list[dict], max_rows: int):
+        self.contracts = contracts
+        self.rules = rules
+        self.claims = claims
+        self.max_rows = max_rows
+
+    def get_pricing_rules_version(self):
+        return "1"
+
+    def get_contracts_page(self, after, limit):
+        return capped_page(self.contracts, after, limit, self.max_rows)
+
+    def get_pricing_rules_page(self, after, limit):
+        return capped_page(self.rules, after, limit, self.max_rows)
+
+    def get_claims_page(self, after, limit, columns, payer=None, date_from=None, date_to=None):
+        return capped_page(self.claims, after, limit, self.max_rows)
+
+    def bulk_update_claims(self, updates):
+        claims = {claim["id"]: claim for claim in self.claims}
+        for update in updates:
+            claims[update["id"]].update(update)
+        return len(updates)
+
+
+def contract(contract_id: int) -> dict:
+    return {
+        "id": contract_id, "payer_name": f"Payer {contract_id}", "contract_number": f"K{contract_id}",
+        "status": "active", "effective_date": "2025-01-01", "expiration_date": "2025-12-31",
+    }
+
+
+def rule(rule_id: int, contract_id: int) -> dict:
+    return {
+        "id": rule_id, "contract_id": contract_id, "procedure_code": 99213,
+        "procedure_name": "Office visit", "reimbursement_rate": 100.0, "unit": "fixed",
+    }
+
+
+def claim(claim_id: int, contract_id: int) -> dict:
+    return {
+        "id": claim_id, "payer": f"Payer {contract_id}", "procedure_code": 99213,
+        "date_of_service": "2025-03-01", "billed_amount": 150.0, "expected": None,
+    }
+
+
+def test_reload_pages_through_contracts_and_rules_beyond_the_row_cap():
+    contracts = [contract(contract_id) for contract_id in range(1, 26)]
+    rules = [rule(contract_id, contract_id) for contract_id in range(1, 26)]
+    engine = PricingEngine(FakeDatabase(contracts, rules, [], max_rows=10))
+    engine.reload()
+    assert len(engine.index) == 25
+    assert engine.index.lookup("Payer 25", 99213, "2025-03-01").contract_id == 25
+
+
+def test_reprice_scans_every_page_when_responses_are_capped_below_page_size():
+    contracts = [contract(contract_id) for contract_id in range(1, 4)]
+    rules = [rule(contract_id, contract_id) for contract_id in range(1, 4)]
+    claims = [claim(claim_id, claim_id % 3 + 1) for claim_id in range(1, 26)]
+    database = FakeDatabase(contracts, rules, claims, max_rows=10)
+    engine = PricingEngine(database)
+    engine.reload()
+    assert reprice_claims(database, engine.index, page_size=5000) == {"scanned": 25, "updated": 25}
+    assert all(claim["expected"] == 100.0 for claim in claims)
@@ -0,0 +1,83 @@
+""" Streaming 835 remittance parsing and posting """
+import io
+
+import pytest
+
+from database import ClaimStatus
+from remittance import ISA_LENGTH, Remit, ingest_remittance, iter_remits, iter_segments
+
+ISA = "ISA*00*          *00*          *ZZ*SENDER         *ZZ*RECEIVER       *250101*1200*^*00501*000000001*0*P*:~"
+
+
+def x12(*segments: str, separator: str = "\n") -> bytes:
+    return (ISA + separator + separator.join(segment + "~" for segment in segments)).encode("latin-1")
+
+
+TRANSACTIONS = x12(
+    "GS*HP*SENDER*RECEIVER*20250101*1200*1*X*005010X221A1",
+    "ST*835*0001", "TRN*1*CHK001*1512345678", "N1*PR*AETNA", "CLP*A1*1*100*80", "SE*5*0001",
+    "ST*835*0002", "N1*PR*CIGNA", "CLP*B1*1*200*150", "SE*4*0002",
+    "ST*835*0003", "CLP*C1*4*300*0", "SE*3*0003",
+    "GE*3*1", "IEA*1*000000001",
+)
+
+
+class FakeDatabase:
+    def __init__(self, claims: dict[str, int]):
+        self.claims = claims
+        self.updates: list[dict] = []
+
+    def get_claims_by_claim_ids(self, claim_ids, columns):
+        return [{"id": self.claims[claim_id], "claim_id": claim_id} for claim_id in claim_ids if claim_id in self.claims]
+
+    def bulk_update_claims(self, updates):
+        self.updates.extend(updates)
+        return len(updates)
+
+
+def test_isa_header_is_fixed_width():
+    assert len(ISA) == ISA_LENGTH
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 2, 3, 7, 64])
+def test_segments_split_across_chunk_boundaries(chunk_bytes):
+    expected = list(iter_segments(io.BytesIO(TRANSACTIONS), chunk_bytes=1024 * 1024))
+    assert list(iter_segments(io.BytesIO(TRANSACTIONS), chunk_bytes=chunk_bytes)) == expected
+    assert ["CLP", "A1", "1", "100", "80"] in expected
+    assert expected[-1] == ["IEA", "1", "000000001"]
+
+
+def test_segments_without_line_breaks():
+    data = x12("ST*835*0001", "CLP*A1*1*100*80", "SE*3*0001", separator="")
+    assert [segment[0] for segment in iter_segments(io.BytesIO(data), chunk_bytes=5)] == ["ISA", "ST", "CLP", "SE"]
+
+
+def test_each_transaction_resets_payer_and_check_number():
+    remits = list(iter_remits(iter_segments(io.BytesIO(TRANSACTIONS), chunk_bytes=16)))
+    assert [(remit.claim_id, remit.payer, remit.check_number) for remit in remits] == [
+        ("A1", "AETNA", "CHK001"),
+        ("B1", "CIGNA", None),
+        ("C1", None, None),
+    ]
+
+
+@pytest.mark.parametrize("status_code, paid, status", [
+    ("1", 80.0, ClaimStatus.PAID),
+    ("1", 0.0, ClaimStatus.DENIED),
+    ("19", 50.0, ClaimStatus.PAID),
+    ("4", 0.0, ClaimStatus.DENIED),
+    ("22", -80.0, None),
+])
+def test_clp02_status_mapping(status_code, paid, status):
+    assert Remit("A1", status_code, 100.0, paid).status == status
+
+
+def test_ingest_posts_paid_and_denied_and_skips_reversals():
+    data = x12("ST*835*0001", "CLP*A1*1*100*80", "CLP*B1*1*100*0", "CLP*C1*22*100*-80", "CLP*Z9*1*100*10", "SE*6*0001")
+    database = FakeDatabase({"A1": 1, "B1": 2, "C1": 3})
+    report = ingest_remittance(database, io.BytesIO(data), "era.835")
+    assert sorted(database.updates, key=lambda update: update["id"]) == [
+        {"id": 1, "actual": 80.0, "status": ClaimStatus.PAID},
+        {"id": 2, "actual": 0.0, "status": ClaimStatus.DENIED},
+    ]
+    assert (report["remits"], report["skipped"], report["updated"], report["unmatched"]) == (4, 1, 2, 1)
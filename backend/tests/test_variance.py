@@ -0,0 +1,64 @@
+""" Underpayment detection over pages of changed claims """
+from types import SimpleNamespace
+
+from variance import VarianceDetector
+
+
+class FakeDatabase:
+    """ Claims in memory; like PostgREST, returns at most max_rows rows per request whatever the limit """
+    def __init__(self, claims: list[dict], max_rows: int):
+        self.claims = claims
+        self.max_rows = max_rows
+        self.variances: dict[int, dict] = {}
+        self.runs: list[dict] = []
+
+    def get_last_variance_run(self):
+        return SimpleNamespace(data=self.runs[-1:])
+
+    def get_variance_thresholds(self):
+        return SimpleNamespace(data=[])
+
+    def get_changed_claims_page(self, after, limit, columns, updated_from, updated_to):
+        rows = [claim for claim in self.claims if after is None or claim["id"] > after]
+        return SimpleNamespace(data=rows[:min(limit, self.max_rows)])
+
+    def upsert_claim_variances(self, variances):
+        self.variances.update((variance["id"], variance) for variance in variances)
+
+    def delete_claim_variances(self, ids):
+        return sum(1 for claim_id in ids if self.variances.pop(claim_id, None) is not None)
+
+    def create_variance_run(self, run):
+        self.runs.append(run)
+
+
+def claim(claim_id: int, actual: float) -> dict:
+    return {
+        "id": claim_id, "claim_id": f"C{claim_id}", "payer": "Aetna", "procedure_code": 99213,
+        "date_of_service": "2025-01-02", "expected": 100.0, "actual": actual, "status": "paid",
+    }
+
+
+def test_scans_every_page_when_responses_are_capped_below_page_size():
+    claims = [claim(claim_id, 80.0 if claim_id % 2 else 100.0) for claim_id in range(1, 26)]
+    database = FakeDatabase(claims, max_rows=10)
+    run = VarianceDetector(database, page_size=5000).run(full=True)
+    assert run["scanned"] == 25
+    assert run["flagged"] == 13
+    assert sorted(database.variances) == list(range(1, 26, 2))
+
+
+def test_cleared_claims_are_removed():
+    database = FakeDatabase([claim(1, 80.0)], max_rows=10)
+    detector = VarianceDetector(database, page_size=5000)
+    detector.run(full=True)
+    database.claims = [claim(1, 100.0)]
+    assert detector.run(full=True)["cleared"] == 1
+    assert database.variances == {}
+
+
+def test_unparseable_date_of_service_is_sent_as_null():
+    claims = [claim(1, 80.0), {**claim(2, 80.0), "date_of_service": "sometime in March"}, {**claim(3, 80.0), "date_of_service": "03/04/2025"}]
+    database = FakeDatabase(claims, max_rows=10)
+    assert VarianceDetector(database).run(full=True)["flagged"] == 3
+    assert [database.variances[claim_id]["date_of_service"] for claim_id in (1, 2, 3)] == ["2025-01-02", None, "2025-03-04"]
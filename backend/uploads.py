@@ -0,0 +1,111 @@
+""" Spooled upload handling: documents stay in one spooled temp file from request to parser """
+import hashlib
+import io
+import os
+from tempfile import SpooledTemporaryFile
+from typing import IO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+# Caps on what a batch's zip archives may expand to, checked before anything is decompressed
+MAX_ARCHIVE_MEMBERS = int(os.getenv("MAX_ARCHIVE_MEMBERS", "10000"))
+MAX_BATCH_EXPANDED_BYTES = int(os.getenv("MAX_BATCH_EXPANDED_BYTES", str(2 * 1024 * 1024 * 1024)))
+MAX_REMITTANCE_BYTES = int(os.getenv("MAX_REMITTANCE_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Documents smaller than this stay in memory, larger ones roll over to disk
+SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+CHUNK_BYTES = 1024 * 1024
+
+
+class SpooledUpload(io.RawIOBase):
+    """
+    A document held in a spooled temp file.
+    It reads like a file named after the upload, so it can be handed straight to the
+    parser client, which streams it instead of loading it into memory.
+    """
+    def __init__(self, file: IO[bytes], filename: str, size: int, sha256: str):
+        super().__init__()
+        self._file = file
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+
+    @property
+    def name(self) -> str:
+        return self.filename
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def readinto(self, buffer) -> int:
+        data = self._file.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def _too_large(filename: str, max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"{filename} exceeds the {max_bytes} byte upload limit")
+
+
+def _hash_file(file: IO[bytes]) -> str:
+    """ SHA-256 of a file, read in chunks from the start """
+    file.seek(0)
+    digest = hashlib.sha256()
+    while chunk := file.read(CHUNK_BYTES):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+async def take_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """
+    Take ownership of an UploadFile's spooled temp file without copying it, so the
+    document can outlive the request (e.g. in the job queue).
+    """
+    size = upload.size if upload.size is not None else await run_in_threadpool(upload.file.seek, 0, io.SEEK_END)
+    if size > max_bytes:
+        raise _too_large(upload.filename, max_bytes)
+    file = upload.file
+    sha256 = await run_in_threadpool(_hash_file, file)
+    # The framework closes upload.file when the request finishes; give it an empty stand-in
+    upload.file = io.BytesIO()
+    return SpooledUpload(file, upload.filename, size, sha256)
+
+
+def spool_stream(stream: IO[bytes], filename: str, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """ Copy a stream (e.g. a zip member) into a spooled temp file in chunks, enforcing max_bytes """
+    file = SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while chunk := stream.read(CHUNK_BYTES):
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(filename, max_bytes)
+            digest.update(chunk)
+            file.write(chunk)
+    except BaseException:
+        file.close()
+        raise
+    file.seek(0)
+    return SpooledUpload(file, filename, size, digest.hexdigest())
+
@@ -0,0 +1,156 @@
+""" Incremental underpayment detection over claims """
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Optional
+
+from pricing import normalize_payer, parse_date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAYER = "*"
+VARIANCE_COLUMNS = ["id", "claim_id", "payer", "procedure_code", "date_of_service", "expected", "actual", "status"]
+
+
+@dataclass(frozen=True)
+class Threshold:
+    """ A claim is underpaid when expected - actual is at least min_amount and min_percent of expected """
+    min_amount: float = 0.0
+    min_percent: float = 0.0
+
+    def variance(self, claim: dict[str, Any]) -> Optional[dict[str, Any]]:
+        """ The Claim_Variances row for an underpaid claim, or None """
+        if claim.get("status") != "paid" or claim.get("expected") is None or claim.get("actual") is None:
+            return None
+        expected, actual = float(claim["expected"]), float(claim["actual"])
+        variance = round(expected - actual, 2)
+        if variance <= 0 or expected <= 0:
+            return None
+        variance_percent = round(variance / expected * 100, 2)
+        if variance < self.min_amount or variance_percent < self.min_percent:
+            return None
+        date_of_service = parse_date(claim.get("date_of_service"))
+        return {
+            "id": claim["id"],
+            "claim_id": claim.get("claim_id"),
+            "payer": claim.get("payer"),
+            "procedure_code": claim.get("procedure_code"),
+            # Claims.date_of_service is free text; the Claim_Variances column is a date
+            "date_of_service": date_of_service.isoformat() if date_of_service is not None else None,
+            "expected": expected,
+            "actual": actual,
+            "variance": variance,
+            "variance_percent": variance_percent,
+        }
+
+
+class Thresholds:
+    """ Per payer thresholds, falling back to the '*' row and then to the environment defaults """
+    def __init__(self, rows: Iterable[dict[str, Any]]):
+        self.default = Threshold(
+            float(os.getenv("VARIANCE_MIN_AMOUNT", "0")),
+            float(os.getenv("VARIANCE_MIN_PERCENT", "0")),
+        )
+        self._by_payer = {}
+        for row in rows:
+            threshold = Threshold(float(row.get("min_amount") or 0), float(row.get("min_percent") or 0))
+            if row["payer"] == DEFAULT_PAYER:
+                self.default = threshold
+            else:
+                self._by_payer[normalize_payer(row["payer"])] = threshold
+
+    def for_payer(self, payer: Optional[str]) -> Threshold:
+        return self._by_payer.get(normalize_payer(payer or ""), self.default)
+
+
+class VarianceDetector:
+    """
+    Flags underpaid claims into Claim_Variances.
+    Each run scans only claims whose updated_at is after the previous run's scanned_to,
+    with a small overlap so rows committed late by slow transactions are not missed
+    (re-evaluating a claim is idempotent). Claims that are no longer underpaid are cleared.
+    """
+    def __init__(self, database, page_size: int = 5000, interval_seconds: float = 0.0, overlap_seconds: float = 60.0):
+        self.database = database
+        self.page_size = page_size
+        self.interval_seconds = interval_seconds
+        self.overlap_seconds = overlap_seconds
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def run(self, full: bool = False) -> dict[str, Any]:
+        """ Scan claims changed since the last run (or every claim when full) and update Claim_Variances """
+        if not self._lock.acquire(blocking=False):
+            return {"skipped": True, "reason": "A variance run is already in progress"}
+        try:
+            return self._run(full)
+        finally:
+            self._lock.release()
+
+    def _run(self, full: bool) -> dict[str, Any]:
+        started_at = datetime.now(timezone.utc)
+        scanned_from = None
+        if not full:
+            last_runs = self.database.get_last_variance_run().data
+            if last_runs:
+                scanned_from = (datetime.fromisoformat(last_runs[0]["scanned_to"]) - timedelta(seconds=self.overlap_seconds)).isoformat()
+        scanned_to = started_at.isoformat()
+        thresholds = Thresholds(self.database.get_variance_thresholds().data)
+
+        scanned = flagged = cleared = 0
+        after = None
+        while True:
+            page = self.database.get_changed_claims_page(after, self.page_size, VARIANCE_COLUMNS, scanned_from, scanned_to).data
+            if not page:
+                break
+            scanned += len(page)
+            variances = []
+            cleared_ids = []
+            for claim in page:
+                variance = thresholds.for_payer(claim.get("payer")).variance(claim)
+                if variance is not None:
+                    variances.append(variance)
+                else:
+                    cleared_ids.append(claim["id"])
+            if variances:
+                self.database.upsert_claim_variances(variances)
+                flagged += len(variances)
+            if cleared_ids:
+                cleared += self.database.delete_claim_variances(cleared_ids)
+            # A short page isn't the last one: PostgREST caps every response at its max-rows setting
+            after = page[-1]["id"]
+
+        run = {
+            "started_at": started_at.isoformat(),
+            "scanned_from": scanned_from,
+            "scanned_to": scanned_to,
+            "scanned": scanned,
+            "flagged": flagged,
+            "cleared": cleared,
+        }
+        self.database.create_variance_run(run)
+        logger.info("Variance run: scanned %s claims, flagged %s, cleared %s", scanned, flagged, cleared)
+        return run
+
+    async def start(self):
+        """ Run detection every interval_seconds, if configured """
+        if self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._schedule())
+
+    async def stop(self):
+        """ Stop the scheduled runs """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _schedule(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await asyncio.to_thread(self.run)
+            except Exception as e:
+                logger.error("Variance run failed: %s", str(e))
@@ -29,7 +29,7 @@ export function KeyMetrics({ analytics }: KeyMetricsProps) {
     },
     {
       title: "Avg Processing Time",
-      value: `${analytics.averageReimbursementTime} days`,
+      value: analytics.averageReimbursementTime === null ? "N/A" : `${analytics.averageReimbursementTime} days`,
       subtitle: "From submission to payment",
       icon: Clock,
       trend: "neutral",
@@ -44,7 +44,7 @@ export interface Analytics {
   revenueVariance: number
   claimsProcessed: number
   claimsPending: number
-  averageReimbursementTime: number
+  averageReimbursementTime: number | null
   denialRate: number
   topDenialReasons: Array<{ reason: string; count: number }>
   revenueByPayer: Array<{ payer: string; amount: number }>